@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índice em memória das contas salvas e API HTTP/JSON somente leitura
+Mantido atualizado pelo pipeline de testes e pela revalidação, responde consultas
+por status, vencimento, número de canais, servidor e canal de origem sem reler o
+CSV/SQLite a cada pedido
+
+Uso:
+    GET /contas?status=active&trial=false&canais_min=5000&vence_depois=2026-12-01
+    GET /contas?servidor=painel.exemplo.com&ordem=-canais&limite=20&offset=40
+    GET /contas?hash_playlist=<hash>   (contas que servem a mesma playlist)
+    GET /resumo
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import re
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+
+Key = Tuple[str, str]
+
+_TRIAL_OBS = re.compile(r'Trial: (\w+)')
+
+
+def _timestamp(value: str) -> Optional[float]:
+    for fmt in (DATE_FORMAT, '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _trial(row: Dict) -> Optional[bool]:
+    value = row.get('trial', '')
+    observacoes = row.get('observacoes', '')
+    if not value and 'API Xtream indisponível' not in observacoes:
+        # Linhas gravadas antes da coluna trial: o valor está nas observações
+        match = _TRIAL_OBS.search(observacoes)
+        value = match.group(1) if match else ''
+    value = value.lower()
+    if value in ('1', 'true'):
+        return True
+    if value in ('0', 'false'):
+        return False
+    return None
+
+
+class _Entry:
+    __slots__ = ('row', 'status', 'servidor', 'canal', 'playlist', 'trial', 'vencimento', 'canais', 'testado')
+
+    def __init__(self, row: Dict):
+        self.row = row
+        self.status = row.get('status', '').lower()
+        self.servidor = row.get('servidor', '').lower()
+        self.canal = row.get('canal_origem', '')
+        self.playlist = row.get('hash_playlist', '')
+        self.trial = _trial(row)
+        self.vencimento = _timestamp(row.get('data_vencimento', ''))
+        self.canais = _int(row.get('total_canais'))
+        self.testado = _timestamp(row.get('data_teste', '')) or 0.0
+
+
+# Ordenações aceitas em ?ordem= (prefixo "-" para decrescente); sem valor vai para o fim
+_ORDENS = {
+    'vencimento': lambda e: e.vencimento,
+    'canais': lambda e: e.canais,
+    'data_teste': lambda e: e.testado,
+}
+
+
+class AccountsIndex:
+    """
+    Última versão de cada conta (servidor + username) com índices por campo
+
+    Status, servidor, canal de origem e playlist têm índices de igualdade; vencimento e
+    número de canais ficam em listas ordenadas para consultas por faixa. Uma
+    consulta parte do menor conjunto de candidatos e filtra o restante.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Key, _Entry] = {}
+        self._by_status: Dict[str, Set[Key]] = defaultdict(set)
+        self._by_server: Dict[str, Set[Key]] = defaultdict(set)
+        self._by_canal: Dict[str, Set[Key]] = defaultdict(set)
+        self._by_playlist: Dict[str, Set[Key]] = defaultdict(set)
+        self._by_expiry: List[Tuple[float, str, str]] = []
+        self._by_channels: List[Tuple[int, str, str]] = []
+        self.loading = False
+        self._pending: List[Dict] = []
+        self._pending_updates: List[Dict] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def load(self, store):
+        """
+        Carrega as contas do armazenamento fora do event loop
+
+        Linhas que chegarem durante a carga são guardadas e aplicadas no fim,
+        por cima do que foi lido (são mais novas).
+        """
+        self.loading = True
+        loop = asyncio.get_running_loop()
+        try:
+            rows = await loop.run_in_executor(None, store.load_rows)
+            await loop.run_in_executor(None, self._add_many, rows)
+        except Exception as e:
+            logger.error(f"Erro ao carregar o índice de contas: {e!r}")
+        finally:
+            pending, self._pending = self._pending, []
+            updates, self._pending_updates = self._pending_updates, []
+            self.loading = False
+            self._add_many(pending)
+            for row in updates:
+                self._update(row)
+        logger.info(f"Índice de contas carregado: {len(self._entries)} conta(s)")
+
+    def add(self, row: Dict):
+        """Indexa uma linha salva (substitui a versão anterior da conta)"""
+        if self.loading:
+            self._pending.append(row)
+            return
+        self._add(row)
+
+    def update_many(self, rows: Iterable[Dict]):
+        """Aplica campos atualizados (servidor, username e o que mudou) sobre a versão atual da conta"""
+        for row in rows:
+            if self.loading:
+                self._pending_updates.append(row)
+            else:
+                self._update(row)
+
+    def _update(self, row: Dict):
+        current = self._entries.get((row.get('servidor'), row.get('username')))
+        if current is not None:
+            self._add({**current.row, **row})
+
+    def _add_many(self, rows: Iterable[Dict]):
+        for row in rows:
+            self._add(row)
+
+    def _add(self, row: Dict):
+        if not row.get('servidor') or not row.get('username'):
+            return
+        key = (row['servidor'], row['username'])
+        old = self._entries.get(key)
+        if old is not None:
+            self._unindex(key, old)
+        entry = self._entries[key] = _Entry(row)
+        self._by_status[entry.status].add(key)
+        self._by_server[entry.servidor].add(key)
+        self._by_canal[entry.canal].add(key)
+        if entry.playlist:
+            self._by_playlist[entry.playlist].add(key)
+        if entry.vencimento is not None:
+            bisect.insort(self._by_expiry, (entry.vencimento,) + key)
+        if entry.canais is not None:
+            bisect.insort(self._by_channels, (entry.canais,) + key)
+
+    def _unindex(self, key: Key, entry: _Entry):
+        for index, value in ((self._by_status, entry.status), (self._by_server, entry.servidor),
+                             (self._by_canal, entry.canal), (self._by_playlist, entry.playlist)):
+            if value not in index:
+                continue
+            keys = index[value]
+            keys.discard(key)
+            if not keys:
+                del index[value]
+        for values, value in ((self._by_expiry, entry.vencimento), (self._by_channels, entry.canais)):
+            if value is not None:
+                i = bisect.bisect_left(values, (value,) + key)
+                if i < len(values) and values[i] == (value,) + key:
+                    del values[i]
+
+    @staticmethod
+    def _range(values: List[Tuple], low, high) -> Set[Key]:
+        start = 0 if low is None else bisect.bisect_left(values, (low,))
+        end = len(values) if high is None else bisect.bisect_right(values, (high, '\uffff'))
+        return {item[1:] for item in values[start:end]}
+
+    def query(self, status: Optional[List[str]] = None, servidor: Optional[str] = None,
+              canal_origem: Optional[str] = None, hash_playlist: Optional[str] = None,
+              trial: Optional[bool] = None,
+              canais_min: Optional[int] = None, canais_max: Optional[int] = None,
+              vence_depois: Optional[float] = None, vence_antes: Optional[float] = None,
+              ordem: str = '-data_teste', offset: int = 0, limite: int = LIMITE_PADRAO) -> Tuple[int, List[Dict]]:
+        """
+        Contas que atendem a todos os filtros informados
+
+        Returns:
+            (total de contas encontradas, linhas da página pedida)
+        """
+        candidates: List[Set[Key]] = []
+        if status:
+            candidates.append(set().union(*(self._by_status.get(s.lower(), ()) for s in status)))
+        if servidor:
+            candidates.append(self._by_server.get(servidor.lower(), set()))
+        if canal_origem:
+            candidates.append(self._by_canal.get(canal_origem, set()))
+        if hash_playlist:
+            candidates.append(self._by_playlist.get(hash_playlist, set()))
+        if canais_min is not None or canais_max is not None:
+            candidates.append(self._range(self._by_channels, canais_min, canais_max))
+        if vence_depois is not None or vence_antes is not None:
+            candidates.append(self._range(self._by_expiry, vence_depois, vence_antes))
+
+        if candidates:
+            candidates.sort(key=len)
+            keys = set(candidates[0])
+            for other in candidates[1:]:
+                keys &= other
+            entries = [self._entries[key] for key in keys]
+        else:
+            entries = list(self._entries.values())
+        if trial is not None:
+            entries = [entry for entry in entries if entry.trial is trial]
+
+        field = ordem.lstrip('-')
+        value = _ORDENS[field]
+        reverse = ordem.startswith('-')
+        present = [entry for entry in entries if value(entry) is not None]
+        present.sort(key=value, reverse=reverse)
+        present.extend(entry for entry in entries if value(entry) is None)
+        page = present[offset:offset + limite]
+        return len(entries), [entry.row for entry in page]
+
+    def summary(self) -> Dict:
+        """Totais por status, por trial, os canais de origem com mais contas e as playlists mais repetidas"""
+        trials = Counter(entry.trial for entry in self._entries.values())
+        playlists = sorted(((digest, len(keys)) for digest, keys in self._by_playlist.items() if len(keys) > 1),
+                           key=lambda item: item[1], reverse=True)
+        return {
+            'total': len(self._entries),
+            'servidores': len(self._by_server),
+            'status': {status: len(keys) for status, keys in sorted(self._by_status.items())},
+            'trial': {'sim': trials[True], 'nao': trials[False], 'desconhecido': trials[None]},
+            'canal_origem': dict(sorted(((canal, len(keys)) for canal, keys in self._by_canal.items()),
+                                        key=lambda item: item[1], reverse=True)[:20]),
+            'playlists': {'distintas': len(self._by_playlist), 'repetidas': dict(playlists[:20])}
+        }
+
+
+class AccountsAPI:
+    """Endpoint HTTP somente leitura /contas e /resumo sobre o índice de contas"""
+
+    def __init__(self, index: AccountsIndex, store=None, host: str = '127.0.0.1', port: int = 9110):
+        self.index = index
+        self.store = store
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _json(data: Dict, status: int = 200) -> web.Response:
+        return web.json_response(data, status=status, dumps=lambda d: json.dumps(d, ensure_ascii=False))
+
+    @staticmethod
+    def _params(query) -> Dict:
+        """Converte a query string nos argumentos de AccountsIndex.query (ValueError se inválida)"""
+        params = {}
+        if query.get('status'):
+            params['status'] = [s.strip() for s in query['status'].split(',') if s.strip()]
+        for name in ('servidor', 'canal_origem', 'hash_playlist'):
+            if query.get(name):
+                params[name] = query[name]
+        if query.get('trial'):
+            if query['trial'].lower() not in ('true', 'false'):
+                raise ValueError('trial deve ser true ou false')
+            params['trial'] = query['trial'].lower() == 'true'
+        for name in ('canais_min', 'canais_max'):
+            if query.get(name):
+                params[name] = int(query[name])
+        for name in ('vence_depois', 'vence_antes'):
+            if query.get(name):
+                value = _timestamp(query[name])
+                if value is None:
+                    raise ValueError(f"{name} deve estar no formato AAAA-MM-DD")
+                params[name] = value
+        ordem = query.get('ordem', '-data_teste')
+        if ordem.lstrip('-') not in _ORDENS:
+            raise ValueError(f"ordem deve ser uma de: {', '.join(_ORDENS)} (prefixo - para decrescente)")
+        params['ordem'] = ordem
+        params['offset'] = max(0, int(query.get('offset', 0)))
+        params['limite'] = min(LIMITE_MAXIMO, max(1, int(query.get('limite', LIMITE_PADRAO))))
+        return params
+
+    async def _handle_contas(self, request):
+        if self.index.loading:
+            return self._json({'erro': 'Índice de contas carregando, tente novamente'}, status=503)
+        try:
+            params = self._params(request.query)
+        except ValueError as e:
+            return self._json({'erro': str(e)}, status=400)
+        total, contas = self.index.query(**params)
+        return self._json({
+            'total': total,
+            'offset': params['offset'],
+            'limite': params['limite'],
+            'contas': contas
+        })
+
+    async def _handle_resumo(self, request):
+        if self.index.loading:
+            return self._json({'erro': 'Índice de contas carregando, tente novamente'}, status=503)
+        return self._json(self.index.summary())
+
+    async def start(self):
+        """Carrega o índice em background e inicia o endpoint no event loop atual (idempotente)"""
+        if self.store is not None and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.index.load(self.store))
+        if self.port and self._runner is None:
+            app = web.Application()
+            app.router.add_get('/contas', self._handle_contas)
+            app.router.add_get('/resumo', self._handle_resumo)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            try:
+                await web.TCPSite(runner, self.host, self.port).start()
+            except OSError as e:
+                await runner.cleanup()
+                logger.error(f"Não foi possível abrir a API de contas em {self.host}:{self.port}: {str(e)}")
+            else:
+                self._runner = runner
+                logger.info(f"API de contas disponível em http://{self.host}:{self.port}/contas")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
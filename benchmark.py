@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark offline do pipeline do bot
+Sobe um servidor Xtream/M3U falso local e envia mensagens sintéticas pelo mesmo
+handler usado com o Telethon, medindo vazão, latência por link, memória e CPU por etapa
+
+Uso:
+    python benchmark.py --mensagens 50 --links-por-mensagem 4 --canais 5000 --latencia 0.05
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List
+
+from aiohttp import web
+
+import telegram_iptv_bot as bot
+
+STAGES = ['detect', 'test', 'api', 'persist', 'webhook']
+
+
+# ----------------------------------------------------------------------
+# Servidor falso (roda em outro processo para não somar CPU ao bot)
+# ----------------------------------------------------------------------
+
+def account_state(username: str, estados: Dict[str, float]) -> str:
+    """Estado determinístico da conta a partir do username"""
+    point = (zlib.crc32(username.encode()) % 10000) / 10000
+    acumulado = 0.0
+    for estado, peso in estados.items():
+        acumulado += peso
+        if point < acumulado:
+            return estado
+    return 'active'
+
+
+def build_fake_app(canais: int, latencia: float, estados: Dict[str, float]) -> web.Application:
+    """Aplicação aiohttp que imita um painel Xtream Codes e um webhook n8n"""
+
+    async def delay():
+        if latencia:
+            await asyncio.sleep(latencia * random.uniform(0.5, 1.5))
+
+    async def get_php(request):
+        await delay()
+        username = request.query.get('username', '')
+        response = web.StreamResponse(headers={'Content-Type': 'audio/x-mpegurl'})
+        await response.prepare(request)
+        await response.write(b'#EXTM3U\n')
+        chunk = []
+        for i in range(canais):
+            kind = ('live', 'movie', 'series')[i % 3]
+            chunk.append(
+                f'#EXTINF:-1 tvg-id="c{i}" tvg-name="Canal {i}" group-title="Grupo {i % 25}",Canal {i}\n'
+                f'http://{request.host}/{kind}/{username}/p/{i}.ts\n'
+            )
+            if len(chunk) >= 500:
+                await response.write(''.join(chunk).encode())
+                chunk = []
+        if chunk:
+            await response.write(''.join(chunk).encode())
+        await response.write_eof()
+        return response
+
+    async def player_api(request):
+        await delay()
+        username = request.query.get('username', '')
+        estado = account_state(username, estados)
+        if estado == 'offline':
+            return web.Response(status=503)
+
+        action = request.query.get('action')
+        if action:
+            key = 'series_id' if action == 'get_series' else 'stream_id'
+            total = canais // 3
+            return web.json_response([{key: i, 'num': i, 'name': f'Item {i}'} for i in range(total)])
+
+        if estado == 'invalid':
+            return web.json_response({'user_info': {'auth': 0}})
+        now = int(time.time())
+        return web.json_response({'user_info': {
+            'auth': 1,
+            'username': username,
+            'status': 'Expired' if estado == 'expired' else ('Disabled' if estado == 'disabled' else 'Active'),
+            'exp_date': str(now - 86400 if estado == 'expired' else now + 30 * 86400),
+            'created_at': str(now - 90 * 86400),
+            'is_trial': '0',
+            'active_cons': '0',
+            'max_connections': '1'
+        }})
+
+    async def hook(request):
+        await request.read()
+        return web.json_response({'ok': True})
+
+    async def stream(request):
+        return web.Response(body=b'\x47' * 188, status=206)
+
+    app = web.Application()
+    app.router.add_get('/get.php', get_php)
+    app.router.add_get('/player_api.php', player_api)
+    app.router.add_post('/hook', hook)
+    app.router.add_get('/{kind}/{username}/{password}/{name}', stream)
+    return app
+
+
+def run_fake_server(hosts: List[str], port: int, canais: int, latencia: float, estados: Dict[str, float]):
+    web.run_app(build_fake_app(canais, latencia, estados), host=hosts, port=port,
+                print=None, access_log=None)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Servidor falso não respondeu na porta {port}")
+
+
+# ----------------------------------------------------------------------
+# Instrumentação
+# ----------------------------------------------------------------------
+
+class StageTimer:
+    """Acumula tempo de parede e CPU por etapa"""
+
+    def __init__(self):
+        self.wall = {stage: [] for stage in STAGES}
+        self.cpu = {stage: 0.0 for stage in STAGES}
+
+    def wrap_sync(self, stage: str, func):
+        def wrapper(*args, **kwargs):
+            start, cpu = time.perf_counter(), time.process_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.cpu[stage] += time.process_time() - cpu
+                self.wall[stage].append(time.perf_counter() - start)
+        return wrapper
+
+    def wrap_async(self, stage: str, func):
+        async def wrapper(*args, **kwargs):
+            # Em etapas assíncronas a CPU inclui o que rodou em paralelo no loop (aproximado)
+            start, cpu = time.perf_counter(), time.process_time()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.cpu[stage] += time.process_time() - cpu
+                self.wall[stage].append(time.perf_counter() - start)
+        return wrapper
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def make_messages(base_urls: List[str], total: int, links_per_message: int, noise: float) -> List[SimpleNamespace]:
+    """Mensagens sintéticas no formato mínimo usado pelo handler"""
+    messages = []
+    user = 0
+    for i in range(total):
+        if random.random() < noise:
+            text = f"Bom dia! Mensagem sem links número {i}"
+        else:
+            links = []
+            for _ in range(links_per_message):
+                base_url = base_urls[user % len(base_urls)]
+                links.append(f"{base_url}/get.php?username=user{user}&password=pass{user}&type=m3u_plus&output=ts")
+                user += 1
+            text = "🔥 Lista IPTV nova\n" + "\n".join(links)
+        message = SimpleNamespace(id=i + 1, text=text, message=text, date=datetime.now(),
+                                  entities=None, reply_markup=None)
+        messages.append(SimpleNamespace(message=message, chat=SimpleNamespace(title='Benchmark', id=-100)))
+    return messages
+
+
+# ----------------------------------------------------------------------
+# Execução
+# ----------------------------------------------------------------------
+
+async def run_benchmark(timer: StageTimer, messages: List[SimpleNamespace]) -> Dict:
+    latencies = []
+    app = bot.app
+
+    original_submit = app.link_pool.submit
+    original_process = bot.processar_link
+
+    async def submit(job):
+        job['_enfileirado_em'] = time.perf_counter()
+        await original_submit(job)
+
+    async def process(job):
+        try:
+            await original_process(job)
+        finally:
+            latencies.append(time.perf_counter() - job['_enfileirado_em'])
+
+    app.link_pool.submit = submit
+    bot.processar_link = process
+
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(bot.handler(event) for event in messages))
+    await app.link_pool.join()
+    if app.webhook_dispatcher:
+        while app.webhook_dispatcher.pending():
+            await asyncio.sleep(0.05)
+    app.store.flush()
+    elapsed = time.perf_counter() - start_wall
+    cpu_total = time.process_time() - start_cpu
+
+    await bot.fechar_conexoes()
+
+    return {
+        'links': len(latencies),
+        'mensagens': len(messages),
+        'segundos': elapsed,
+        'links_por_segundo': len(latencies) / elapsed if elapsed else 0.0,
+        'latencia_p50': percentile(latencies, 50),
+        'latencia_p99': percentile(latencies, 99),
+        'cpu_total': cpu_total,
+        'pico_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'etapas': {
+            stage: {
+                'chamadas': len(timer.wall[stage]),
+                'parede_total': sum(timer.wall[stage]),
+                'parede_p50': percentile(timer.wall[stage], 50),
+                'parede_p99': percentile(timer.wall[stage], 99),
+                'cpu': timer.cpu[stage]
+            }
+            for stage in STAGES
+        }
+    }
+
+
+def parse_estados(raw: str) -> Dict[str, float]:
+    estados = {}
+    for item in raw.split(','):
+        nome, peso = item.split('=', 1)
+        estados[nome.strip()] = float(peso)
+    total = sum(estados.values()) or 1.0
+    return {nome: peso / total for nome, peso in estados.items()}
+
+
+def print_report(result: Dict):
+    print("=" * 60)
+    print("BENCHMARK - BOT TELEGRAM IPTV")
+    print("=" * 60)
+    print(f"Mensagens: {result['mensagens']}  Links: {result['links']}  Tempo: {result['segundos']:.2f}s")
+    print(f"Vazão: {result['links_por_segundo']:.1f} links/s")
+    print(f"Latência por link: p50 {result['latencia_p50'] * 1000:.0f} ms, p99 {result['latencia_p99'] * 1000:.0f} ms")
+    print(f"CPU total: {result['cpu_total']:.2f}s  Pico de RSS: {result['pico_rss_mb']:.1f} MB")
+    print()
+    print(f"{'Etapa':<10}{'Chamadas':>10}{'p50 ms':>10}{'p99 ms':>10}{'Parede s':>10}{'CPU s':>10}")
+    for stage, data in result['etapas'].items():
+        print(f"{stage:<10}{data['chamadas']:>10}{data['parede_p50'] * 1000:>10.1f}"
+              f"{data['parede_p99'] * 1000:>10.1f}{data['parede_total']:>10.2f}{data['cpu']:>10.3f}")
+    print("(CPU das etapas assíncronas inclui outras tarefas do loop: valor aproximado)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark offline do bot IPTV')
+    parser.add_argument('--mensagens', type=int, default=50)
+    parser.add_argument('--links-por-mensagem', type=int, default=4)
+    parser.add_argument('--ruido', type=float, default=0.2, help='Fração de mensagens sem links')
+    parser.add_argument('--servidores', type=int, default=4, help='Servidores IPTV simulados')
+    parser.add_argument('--canais', type=int, default=3000, help='Entradas por playlist')
+    parser.add_argument('--latencia', type=float, default=0.05, help='Latência média do servidor (s)')
+    parser.add_argument('--estados', default='active=0.7,expired=0.15,invalid=0.1,offline=0.05',
+                        help='Proporção de estados das contas')
+    parser.add_argument('--contagem', default='m3u', choices=['api', 'm3u', 'nenhuma'],
+                        help='CONTAGEM_CANAIS usada no teste')
+    parser.add_argument('--armazenamento', default='sqlite', choices=['sqlite', 'csv'])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verboso', action='store_true', help='Mostra a saída do bot durante o teste')
+    parser.add_argument('--json', dest='json_path', default='', help='Salva o resultado em JSON')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    port = free_port()
+    # Cada endereço de loopback conta como um servidor IPTV diferente (limites por host:porta)
+    hosts = [f"127.0.0.{i}" for i in range(1, max(1, args.servidores) + 1)]
+    base_urls = [f"http://{host}:{port}" for host in hosts]
+    base_url = base_urls[0]
+    server = multiprocessing.Process(
+        target=run_fake_server,
+        args=(hosts, port, args.canais, args.latencia, parse_estados(args.estados)),
+        daemon=True
+    )
+    server.start()
+    wait_port(port)
+
+    workdir = tempfile.mkdtemp(prefix='iptv-bench-')
+    os.environ.update({
+        'API_ID': os.getenv('API_ID', '1'),
+        'API_HASH': os.getenv('API_HASH', 'benchmark'),
+        'CANAL_ORIGEM': 'Benchmark',
+        'PALAVRAS_CHAVE': '',
+        'PALAVRAS_BLOQUEADAS': '',
+        'WEBHOOK_URL': f"{base_url}/hook",
+        'CACHE_ATIVO': 'false',
+        'CONTAGEM_CANAIS': args.contagem,
+        'ARMAZENAMENTO': args.armazenamento,
+    })
+    os.chdir(workdir)
+
+    # O handler e os componentes reais, criados a partir do ambiente acima, sem conectar ao Telegram
+    bot.carregar_configuracao()
+    app = bot.app
+    timer = StageTimer()
+    bot.detect_m3u_links = timer.wrap_sync('detect', bot.detect_m3u_links)
+    app.iptv_tester.test_m3u_url = timer.wrap_async('test', app.iptv_tester.test_m3u_url)
+    app.xtream_api.get_account_info = timer.wrap_async('api', app.xtream_api.get_account_info)
+    app.xtream_api.get_stream_counts = timer.wrap_async('api', app.xtream_api.get_stream_counts)
+    app.store.save = timer.wrap_sync('persist', app.store.save)
+    if app.webhook_dispatcher:
+        app.webhook_dispatcher.send = timer.wrap_async('webhook', app.webhook_dispatcher.send)
+
+    messages = make_messages(base_urls, args.mensagens, args.links_por_mensagem, args.ruido)
+
+    if not args.verboso:
+        logging.getLogger().setLevel(logging.CRITICAL)
+    try:
+        # A saída do bot distorce a medição e esconde o relatório
+        with contextlib.redirect_stdout(sys.stdout if args.verboso else io.StringIO()):
+            result = asyncio.run(run_benchmark(timer, messages))
+    finally:
+        server.terminate()
+        server.join()
+
+    result['parametros'] = vars(args)
+    print_report(result)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nResultado salvo em {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Importação em massa de listas IPTV
+Testa links de um arquivo (texto ou JSONL) ou do histórico de um canal do
+Telegram usando o mesmo pipeline do bot, com alta concorrência, gravação em
+lote e checkpoint para retomar uma execução interrompida
+
+Uso:
+    python bulk_import.py arquivo links.txt
+    python bulk_import.py arquivo mensagens.jsonl --sem-webhook
+    python bulk_import.py historico "Nome do Canal" --desde 2026-01-01
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from link_detector import message_urls
+from worker_pool import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = 'importacao_checkpoint.json'
+# Sessão própria: a do bot fica aberta (SQLite do Telethon) enquanto ele roda
+SESSION_FILE = 'session_importacao'
+
+# (posição, texto, URLs extras, canal_titulo, canal_id, mensagem_id, mensagem_data)
+Item = Tuple[int, str, List[str], str, Optional[int], Optional[int], Optional[str]]
+
+
+class Checkpoint:
+    """
+    Posição até a qual a entrada já foi totalmente processada
+
+    Os links terminam fora de ordem no pool; a posição salva é a maior
+    posição P tal que todos os itens até P já terminaram. Antes de salvar,
+    `flush` grava o que o armazenamento ainda tem em memória (lote do CSV, fila
+    do SQLite), para o checkpoint nunca passar de linhas que não foram gravadas.
+    Flush e escrita do arquivo rodam em uma thread, sem travar os testes em
+    andamento no event loop.
+    """
+
+    def __init__(self, path: str, source: str, reset: bool = False,
+                 flush: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.source = source
+        self.flush = flush
+        self._data: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Checkpoint inválido em {path}, ignorando: {str(e)}")
+        if reset:
+            self._data.pop(source, None)
+        self.position = int(self._data.get(source, {}).get('posicao', 0))
+        self._pending: Dict[int, int] = {}
+        self._finished: List[int] = []
+        self._order: List[int] = []
+        self._saved_at = time.monotonic()
+        self._save_lock = asyncio.Lock()
+        self._save_task: Optional[asyncio.Task] = None
+
+    def add(self, position: int, jobs: int):
+        """Registra um item da entrada com `jobs` links em teste"""
+        heapq.heappush(self._order, position)
+        if jobs:
+            self._pending[position] = jobs
+        else:
+            heapq.heappush(self._finished, position)
+        self._advance()
+
+    def done(self, position: int):
+        """Um link do item terminou"""
+        self._pending[position] -= 1
+        if not self._pending[position]:
+            del self._pending[position]
+            heapq.heappush(self._finished, position)
+            self._advance()
+
+    def _advance(self):
+        while self._order and self._finished and self._order[0] == self._finished[0]:
+            self.position = heapq.heappop(self._order)
+            heapq.heappop(self._finished)
+        if time.monotonic() - self._saved_at >= 5 and (self._save_task is None or self._save_task.done()):
+            self._saved_at = time.monotonic()
+            self._save_task = asyncio.get_running_loop().create_task(self.save())
+
+    async def save(self):
+        """Grava o armazenamento e depois a posição atual (uma gravação por vez)"""
+        async with self._save_lock:
+            # As linhas até esta posição já foram entregues ao armazenamento
+            position = self.position
+            await asyncio.get_running_loop().run_in_executor(None, self._write, position)
+
+    def _write(self, position: int):
+        if self.flush is not None:
+            try:
+                self.flush()
+            except Exception as e:
+                # Sem a confirmação da gravação o checkpoint fica onde estava
+                logger.error(f"Erro ao gravar os resultados, checkpoint mantido: {str(e)}")
+                self._saved_at = time.monotonic()
+                return
+        self._data[self.source] = {
+            'posicao': position,
+            'atualizado_em': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Erro ao salvar checkpoint: {str(e)}")
+        self._saved_at = time.monotonic()
+
+
+def read_file(path: str, formato: str, start: int) -> Iterator[Item]:
+    """
+    Lê o arquivo linha a linha (sem carregá-lo inteiro na memória)
+
+    txt: cada linha é um texto onde os links são procurados
+    jsonl: cada linha é um objeto com "texto" (ou "text"/"message"), "url" ou
+    "links", e opcionalmente "canal_origem", "canal_id", "mensagem_id" e "data"
+    """
+    titulo = os.path.basename(path)
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for number, line in enumerate(f, 1):
+            if number <= start:
+                continue
+            line = line.strip()
+            if not line:
+                yield (number, '', [], titulo, None, None, None)
+                continue
+            if formato == 'txt':
+                yield (number, line, [], titulo, None, number, None)
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                logger.warning(f"Linha {number} não é JSON válido, ignorando")
+                yield (number, '', [], titulo, None, None, None)
+                continue
+            texto = data.get('texto') or data.get('text') or data.get('message') or ''
+            urls = list(data.get('links') or [])
+            if data.get('url'):
+                urls.append(data['url'])
+            yield (number, texto, urls, data.get('canal_origem') or titulo, data.get('canal_id'),
+                   data.get('mensagem_id', number), data.get('data'))
+
+
+async def read_history(client, canal: str, start: int, limit: Optional[int],
+                       desde: Optional[datetime]) -> AsyncIterator[Item]:
+    """Percorre o histórico do canal da mensagem mais antiga para a mais nova"""
+    entity = await client.get_entity(int(canal) if canal.lstrip('-').isdigit() else canal)
+    titulo = getattr(entity, 'title', canal)
+    kwargs = {'reverse': True, 'limit': limit, 'min_id': start}
+    if desde and not start:
+        kwargs['offset_date'] = desde
+    async for mensagem in client.iter_messages(entity, **kwargs):
+        texto = mensagem.text or mensagem.message or ''
+        yield (mensagem.id, texto, message_urls(mensagem), titulo, entity.id, mensagem.id,
+               mensagem.date.isoformat() if mensagem.date else None)
+
+
+async def _iterate(items):
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def run_import(bot, items, checkpoint: Checkpoint, pool_args: Dict, filtrar: bool) -> Dict[str, int]:
+    """Detecta os links de cada item e os testa no pool, atualizando o checkpoint"""
+    stats = {'itens': 0, 'links': 0, 'ignorados': 0}
+
+    async def process(job: Dict):
+        try:
+            await bot.processar_link(job)
+        finally:
+            checkpoint.done(job['posicao'])
+
+    pool = WorkerPool(process, **pool_args)
+    try:
+        async for position, texto, urls, canal_titulo, canal_id, mensagem_id, mensagem_data in _iterate(items):
+            stats['itens'] += 1
+            if filtrar and texto:
+                filtro = bot.app.text_matcher.scan(texto)
+                if (bot.app.config.palavras_chave and not filtro.has_keyword) or filtro.blocked:
+                    stats['ignorados'] += 1
+                    checkpoint.add(position, 0)
+                    continue
+
+            links = bot.detect_m3u_links(texto, urls)
+            checkpoint.add(position, len(links))
+            stats['links'] += len(links)
+            for m3u_url in links:
+                await pool.submit({
+                    'm3u_url': m3u_url,
+                    'canal_titulo': canal_titulo,
+                    'canal_id': canal_id,
+                    'mensagem_id': mensagem_id,
+                    'mensagem_data': mensagem_data,
+                    'posicao': position
+                })
+
+            if stats['itens'] % 1000 == 0:
+                logger.info(f"Importação: {stats['itens']} item(ns), {stats['links']} link(s), "
+                            f"{pool.qsize()} na fila, checkpoint em {checkpoint.position}")
+
+        await pool.join()
+    finally:
+        await pool.stop()
+        await checkpoint.save()
+    return stats
+
+
+async def _cli(args):
+    # Reaproveita configuração, validação, cache, armazenamento e webhook do bot
+    import telegram_iptv_bot as bot
+
+    app = bot.app
+    bot.carregar_configuracao()
+    if app.store.nome == 'CSV':
+        # Grava o CSV em lotes em vez de abrir o arquivo a cada lista
+        app.store.batch_size = max(1, args.lote)
+    if args.sem_webhook:
+        app.webhook_dispatcher = None
+
+    if args.origem == 'arquivo':
+        formato = args.formato or ('jsonl' if args.entrada.lower().endswith(('.jsonl', '.json')) else 'txt')
+        source = f"arquivo:{os.path.abspath(args.entrada)}"
+    else:
+        source = f"canal:{args.entrada}"
+    checkpoint = Checkpoint(args.checkpoint, source, reset=args.reiniciar, flush=app.store.flush)
+    if checkpoint.position:
+        print(f"[INFO] Retomando {source} a partir da posição {checkpoint.position}")
+
+    pool_args = {
+        'workers': args.workers,
+        'max_concurrency': args.simultaneos,
+        'max_per_server': args.por_servidor,
+        'queue_size': args.workers * 4
+    }
+
+    start = time.perf_counter()
+    try:
+        if args.origem == 'arquivo':
+            items = read_file(args.entrada, formato, checkpoint.position)
+            stats = await run_import(bot, items, checkpoint, pool_args, args.filtrar)
+        else:
+            desde = datetime.strptime(args.desde, '%Y-%m-%d') if args.desde else None
+            from telethon import TelegramClient
+
+            # Cliente sem o handler do bot: só lê o histórico, sem testar as mensagens ao vivo
+            client = TelegramClient(args.sessao, app.config.api_id, app.config.api_hash)
+            await client.start()
+            try:
+                items = read_history(client, args.entrada, checkpoint.position, args.limite or None, desde)
+                stats = await run_import(bot, items, checkpoint, pool_args, not args.sem_filtro)
+            finally:
+                await client.disconnect()
+    finally:
+        if app.webhook_dispatcher:
+            # Entrega o que der em até 30s; o restante fica no spool para o bot
+            await app.webhook_dispatcher.stop(timeout=30)
+        await bot.fechar_conexoes()
+
+    elapsed = time.perf_counter() - start
+    print(f"[OK] Importação concluída em {elapsed:.1f}s")
+    print(f"  • Itens lidos: {stats['itens']} (ignorados pelos filtros: {stats['ignorados']})")
+    print(f"  • Links testados: {stats['links']}")
+    print(f"  • Checkpoint: {checkpoint.position} ({args.checkpoint})")
+
+
+def _bot_session(sessao: str) -> bool:
+    from telegram_iptv_bot import SESSION_FILE as BOT_SESSION_FILE
+
+    name = os.path.basename(sessao)
+    if name.endswith('.session'):
+        name = name[:-len('.session')]
+    return name == BOT_SESSION_FILE
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Importação em massa de listas IPTV')
+    sub = parser.add_subparsers(dest='origem', required=True)
+
+    arquivo = sub.add_parser('arquivo', help='Testa os links de um arquivo texto ou JSONL')
+    arquivo.add_argument('entrada', help='Caminho do arquivo')
+    arquivo.add_argument('--formato', choices=['txt', 'jsonl'], help='Padrão: pela extensão do arquivo')
+    arquivo.add_argument('--filtrar', action='store_true', help='Aplica PALAVRAS_CHAVE e PALAVRAS_BLOQUEADAS')
+
+    historico = sub.add_parser('historico', help='Testa os links do histórico de um canal do Telegram')
+    historico.add_argument('entrada', help='Nome de usuário, título ou ID do canal')
+    historico.add_argument('--desde', help='Data inicial (AAAA-MM-DD)')
+    historico.add_argument('--limite', type=int, default=0, help='Máximo de mensagens')
+    historico.add_argument('--sem-filtro', action='store_true', help='Ignora PALAVRAS_CHAVE e PALAVRAS_BLOQUEADAS')
+    historico.add_argument('--sessao', default=SESSION_FILE,
+                           help='Sessão do Telethon (não use a do bot: ela fica aberta enquanto ele roda)')
+
+    for sp in (arquivo, historico):
+        sp.add_argument('--workers', type=int, default=50)
+        sp.add_argument('--simultaneos', type=int, default=50, help='Testes simultâneos no total')
+        sp.add_argument('--por-servidor', type=int, default=2, help='Testes simultâneos por servidor')
+        sp.add_argument('--lote', type=int, default=500, help='Linhas por gravação no CSV')
+        sp.add_argument('--checkpoint', default=CHECKPOINT_FILE)
+        sp.add_argument('--reiniciar', action='store_true', help='Ignora o checkpoint salvo')
+        sp.add_argument('--sem-webhook', action='store_true', help='Não envia as listas para o webhook')
+
+    args = parser.parse_args()
+    if args.origem == 'historico' and _bot_session(args.sessao):
+        parser.error("--sessao não pode ser a sessão do bot; use uma sessão própria")
+    try:
+        asyncio.run(_cli(args))
+    except KeyboardInterrupt:
+        print("\n[INFO] Importação interrompida; execute de novo para continuar do checkpoint")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache de DNS em processo para os hosts dos painéis IPTV
+Guarda respostas positivas por um TTL, falhas por um TTL negativo mais curto e
+agrupa consultas simultâneas ao mesmo host em uma só
+"""
+
+import asyncio
+import logging
+import socket
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, int, int]
+
+
+class CachingResolver(AbstractResolver):
+    """Resolver do aiohttp com cache (TTL positivo e negativo) sobre o resolver padrão"""
+
+    def __init__(self, ttl: float = 300.0, negative_ttl: float = 30.0, max_hosts: int = 10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_hosts = max_hosts
+        self.hits = 0
+        self.misses = 0
+        self._resolver = None
+        self._loop = None
+        # chave -> (expira_em, resultado ou exceção)
+        self._cache: 'OrderedDict[CacheKey, Tuple[float, object]]' = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[Dict]:
+        key = (host.lower(), port, int(family))
+        entry = self._cache.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self.hits += 1
+                self._cache.move_to_end(key)
+                if isinstance(value, OSError):
+                    raise type(value)(*value.args)
+                return value
+            del self._cache[key]
+
+        # Outra tarefa já está resolvendo este host: aguarda o mesmo resultado
+        future = self._inflight.get(key)
+        if future is not None:
+            self.hits += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        if self._resolver is None or self._loop is not loop:
+            # O resolver padrão fica preso ao event loop em que foi criado
+            self._resolver = DefaultResolver()
+            self._loop = loop
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._resolver.resolve(host, port, family)
+        except OSError as e:
+            self._store(key, e, self.negative_ttl)
+            future.set_exception(e)
+            future.exception()  # evita o aviso de exceção não lida quando ninguém mais aguarda
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            self._store(key, result, self.ttl)
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store(self, key: CacheKey, value, ttl: float):
+        if ttl <= 0:
+            return
+        self._cache[key] = (time.monotonic() + ttl, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_hosts:
+            self._cache.popitem(last=False)
+
+    async def close(self):
+        if self._resolver is not None:
+            await self._resolver.close()
+            self._resolver = None
+            self._loop = None
+
+    def __len__(self) -> int:
+        return len(self._cache)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cliente HTTP assíncrono usado pelos testadores IPTV e pelo webhook
+Mantém conexões keep-alive em pool, com limite global e limite por host, e
+opcionalmente aplica o circuit breaker, os timeouts adaptativos e o limite de
+requisições por segundo por servidor
+"""
+
+import asyncio
+import logging
+import socket
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+
+from rate_limit import RequestLimiter
+from server_health import CLOSED, ServerHealth
+from worker_pool import server_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+
+class AsyncHTTPClient:
+    """Pool de conexões aiohttp criado sob demanda dentro do event loop"""
+
+    def __init__(self, timeout: int = 10, limit: int = 100, limit_per_host: int = 4,
+                 headers: Optional[Dict] = None, keepalive_timeout: int = 30,
+                 health: Optional[ServerHealth] = None, resolver: Optional[AbstractResolver] = None,
+                 limiter: Optional[RequestLimiter] = None):
+        self.timeout = timeout
+        self.health = health
+        self.limiter = limiter
+        self.resolver = resolver
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.headers = headers or {'User-Agent': DEFAULT_USER_AGENT}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def make_timeout(self, timeout: Optional[float] = None,
+                     connect: Optional[float] = None) -> aiohttp.ClientTimeout:
+        """Timeout por conexão e por leitura (mesma semântica do requests)"""
+        value = timeout or self.timeout
+        return aiohttp.ClientTimeout(total=None, sock_connect=min(connect or value, value), sock_read=value)
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Retorna a sessão do loop atual, criando-a na primeira chamada"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            if self.resolver is not None:
+                # O resolver já tem cache próprio (TTL positivo e negativo)
+                dns = {'resolver': self.resolver, 'use_dns_cache': False}
+            else:
+                dns = {'ttl_dns_cache': 300}
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                **dns
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=self.make_timeout()
+            )
+            self._loop = loop
+        return self._session
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, timeout: Optional[float] = None,
+                      track_health: bool = True, **kwargs):
+        """
+        Executa uma requisição e entrega a resposta aberta (para leitura em streaming)
+
+        Com `health`, servidores com o circuito aberto falham na hora com
+        CircuitOpenError e o timeout de conexão acompanha a latência do
+        servidor; a leitura mantém o timeout pedido, porque listagens e
+        playlists demoram mais que as respostas rápidas do player_api.
+        track_health=False ignora o circuito (ex.: sondagem de streams, cujas
+        falhas não dizem nada sobre o painel). Com `limiter`, a requisição
+        aguarda os limites de requisições por segundo (total e do servidor).
+        """
+        session = await self.get_session()
+        key = server_key(url)
+        if self.health is None or not track_health:
+            if self.limiter is not None:
+                await self.limiter.acquire(key)
+            async with session.request(method, url, timeout=self.make_timeout(timeout), **kwargs) as response:
+                yield response
+            return
+
+        self.health.allow(key)
+        connect = self.health.timeout_for(key, timeout or self.timeout)
+        start = time.monotonic()
+        latency = None
+        failed = False
+        try:
+            if self.limiter is not None:
+                # Dentro do try: cancelada na espera, a sonda half-open é liberada
+                await self.limiter.acquire(key)
+                start = time.monotonic()
+            async with session.request(method, url, timeout=self.make_timeout(timeout, connect),
+                                       **kwargs) as response:
+                latency = time.monotonic() - start
+                failed = response.status >= 500
+                yield response
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+            failed = True
+            raise
+        finally:
+            if failed or latency is not None:
+                self.health.record(key, ok=not failed, latency=latency)
+            else:
+                self.health.cancel(key)
+
+    async def get_json(self, url: str, timeout: Optional[float] = None):
+        """GET que valida o status HTTP e decodifica o corpo como JSON"""
+        async with self.request('GET', url, timeout=timeout) as response:
+            response.raise_for_status()
+            # Painéis Xtream costumam responder JSON com Content-Type text/html
+            return await response.json(content_type=None)
+
+    async def post_json(self, url: str, data, timeout: Optional[float] = None) -> int:
+        """POST de um corpo JSON; retorna o status HTTP"""
+        async with self.request('POST', url, timeout=timeout, json=data) as response:
+            if response.status >= 400:
+                body = await response.text()
+                raise aiohttp.ClientResponseError(
+                    response.request_info,
+                    response.history,
+                    status=response.status,
+                    message=body[:500] or (response.reason or ''),
+                    headers=response.headers
+                )
+            return response.status
+
+    async def warmup(self, url: str, connect: bool = False):
+        """
+        Prepara o acesso ao servidor da URL antes do teste
+
+        Resolve o DNS (preenchendo o cache do resolver) e, com connect=True,
+        abre uma conexão keep-alive com um HEAD na raiz do servidor, que fica no
+        pool para a primeira requisição de verdade. Erros são ignorados.
+        """
+        try:
+            parsed = urlparse(url)
+            if not parsed.hostname:
+                return
+            if not connect:
+                if self.resolver is not None:
+                    port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+                    # Mesma família do TCPConnector (AF_UNSPEC) para cair na mesma entrada do cache
+                    await self.resolver.resolve(parsed.hostname, port, family=socket.AF_UNSPEC)
+                return
+            if self.health is not None and self.health.state(server_key(url)) != CLOSED:
+                return
+            session = await self.get_session()
+            root = f"{parsed.scheme}://{parsed.netloc}/"
+            async with session.head(root, allow_redirects=False, timeout=self.make_timeout()) as response:
+                await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
+            logger.debug(f"Pré-conexão com {url[:60]} falhou: {e!r}")
+
+    async def close(self):
+        """Fecha a sessão, as conexões keep-alive e o resolver de DNS"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+        if self.resolver is not None:
+            await self.resolver.close()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Detecção de links M3U/Xtream Codes em mensagens
+Uma única passada de regex pré-compilada, com normalização e remoção de duplicatas em ordem
+"""
+
+import re
+from typing import Iterable, List
+
+from result_cache import normalize_url
+
+# Candidatos: qualquer URL http(s) até espaço, ')', ']' ou '"'
+_URL_RE = re.compile(r'https?://[^\s\)\]\"]+', re.IGNORECASE)
+
+# Pontuação de fim de frase que costuma grudar no link em mensagens. Só ponto e
+# vírgula: ! ? * ; : ' } > podem fazer parte de uma senha no fim da URL
+_TRAILING_PUNCTUATION = '.,'
+
+
+def is_m3u_link(url: str) -> bool:
+    """Verifica se a URL é uma lista M3U (get.php?type=m3u, .m3u ou username/password)"""
+    lower = url.lower()
+
+    index = lower.find('get.php')
+    if index != -1 and 'type=m3u' in lower[index + 7:]:
+        return True
+
+    if '.m3u' in lower:
+        return True
+
+    index = lower.find('username=')
+    return index != -1 and 'password=' in lower[index + 9:]
+
+
+def detect_links(texto: str, extra_urls: Iterable[str] = ()) -> List[str]:
+    """
+    Detecta links M3U no texto e em URLs extras (entidades e botões da mensagem)
+
+    Returns:
+        Links na ordem em que aparecem, sem duplicatas (comparados pela URL normalizada)
+    """
+    candidates = []
+    # Pré-filtro barato: sem '://' não há URL para procurar
+    if texto and '://' in texto:
+        candidates.extend(_URL_RE.findall(texto))
+    for url in extra_urls:
+        if url and '://' in url:
+            candidates.extend(_URL_RE.findall(url))
+
+    links = []
+    seen = set()
+    for candidate in candidates:
+        link = candidate.strip().rstrip(_TRAILING_PUNCTUATION)
+        if not link or not is_m3u_link(link):
+            continue
+        key = normalize_url(link)
+        if key in seen:
+            continue
+        seen.add(key)
+        links.append(link)
+
+    return links
+
+
+def message_urls(mensagem) -> List[str]:
+    """
+    URLs que não aparecem no texto puro da mensagem
+
+    Inclui links de texto (MessageEntityTextUrl) e botões de URL (KeyboardButtonUrl)
+    """
+    urls = []
+
+    for entity in getattr(mensagem, 'entities', None) or []:
+        url = getattr(entity, 'url', None)
+        if url:
+            urls.append(url)
+
+    markup = getattr(mensagem, 'reply_markup', None)
+    for row in getattr(markup, 'rows', None) or []:
+        for button in getattr(row, 'buttons', None) or []:
+            url = getattr(button, 'url', None)
+            if url:
+                urls.append(url)
+
+    return urls
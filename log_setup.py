@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Logging estruturado e assíncrono do bot
+Os registros entram em uma fila (sem bloquear o event loop) e uma thread os
+grava em JSON (ou texto) no stdout, com nível por componente, amostragem de
+eventos repetitivos e credenciais mascaradas
+
+Uso:
+    logger.info("Mensagem ignorada", extra={'amostragem': 'mensagem_ignorada'})
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Credenciais em URLs: parâmetros de senha/token, usuário:senha@ e caminhos Xtream /usuario/senha/id
+_SECRET_PARAM = re.compile(r'((?:password|senha|pass|token|api_key|apikey)=)[^&\s"\']+', re.IGNORECASE)
+_USERINFO = re.compile(r'(://[^/\s:@]+:)[^/\s@]+@')
+_XTREAM_PATH = re.compile(r'(https?://[^/\s]+/(?:live/|movie/|series/)?[^/\s?]+/)[^/\s?]+(/\d+(?:\.\w+)?|/[^/\s?]+\.\w+)')
+
+# Atributos padrão do LogRecord (o resto veio de extra= e vai para o JSON)
+_RESERVED = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime', 'amostragem'}
+
+_state: Dict = {}
+_lock = threading.Lock()
+
+
+def redact(text: str) -> str:
+    """Mascara senhas e tokens em URLs e textos de log"""
+    if not text or ('=' not in text and '://' not in text):
+        return text
+    text = _SECRET_PARAM.sub(r'\1***', text)
+    text = _USERINFO.sub(r'\1***@', text)
+    return _XTREAM_PATH.sub(r'\1***\2', text)
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """Níveis por componente no formato "http_client:WARNING,telethon:ERROR" """
+    levels = {}
+    for item in (spec or '').split(','):
+        if ':' in item:
+            name, level = item.rsplit(':', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class RedactingFilter(logging.Filter):
+    """Mascara as credenciais da mensagem e dos campos extras (na thread de escrita)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = redact(record.getMessage())
+        record.args = None
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and isinstance(value, str):
+                setattr(record, key, redact(value))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Amostragem dos registros marcados com extra={'amostragem': chave}
+
+    Deixa passar no máximo um registro por chave a cada `interval` segundos; o
+    próximo que passar leva em `suprimidos` quantos foram descartados.
+    """
+
+    def __init__(self, interval: float = 10.0):
+        super().__init__()
+        self.interval = interval
+        self._last: Dict[str, float] = {}
+        self._suppressed: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, 'amostragem', None)
+        if key is None or self.interval <= 0:
+            return True
+        now = time.monotonic()
+        if now - self._last.get(key, float('-inf')) < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+        self._last[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suprimidos = suppressed
+            record.msg = f"{record.getMessage()} (+{suppressed} semelhante(s) suprimido(s))"
+            record.args = None
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """Uma linha JSON por registro: horário, nível, componente, mensagem e campos extras"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'componente': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                data[key] = value
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (e conta) registros quando a fila está cheia, sem bloquear"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level: str = 'INFO', levels: Optional[Dict[str, str]] = None, fmt: str = 'json',
+                      sample_interval: float = 10.0, queue_size: int = 10000):
+    """
+    Substitui os handlers da raiz pelo handler em fila (idempotente)
+
+    Args:
+        level: nível padrão (raiz)
+        levels: nível por componente (nome do logger, ex.: {'http_client': 'WARNING'})
+        fmt: 'json' ou 'texto'
+        sample_interval: segundos entre registros de uma mesma chave de amostragem (0 = todos)
+        queue_size: registros aguardando escrita antes de começar a descartar
+    """
+    with _lock:
+        _stop()
+        output = logging.StreamHandler(sys.stdout)
+        if fmt == 'json':
+            output.setFormatter(JSONFormatter())
+        else:
+            output.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
+        output.addFilter(RedactingFilter())
+
+        handler = DroppingQueueHandler(queue.Queue(maxsize=max(1, queue_size)))
+        handler.addFilter(SamplingFilter(sample_interval))
+
+        root = logging.getLogger()
+        for old in root.handlers[:]:
+            root.removeHandler(old)
+        root.addHandler(handler)
+        root.setLevel(level.upper())
+        for name, component_level in (levels or {}).items():
+            logging.getLogger(name).setLevel(component_level)
+
+        _state.update(handler=handler, outputs=[output], pid=os.getpid())
+        _start()
+        if not _state.get('registered'):
+            atexit.register(stop_logging)
+            # Processos criados por fork herdam a fila, mas não a thread de escrita
+            os.register_at_fork(after_in_child=_after_fork)
+            _state['registered'] = True
+
+
+def _start():
+    listener = logging.handlers.QueueListener(_state['handler'].queue, *_state['outputs'],
+                                              respect_handler_level=True)
+    listener.start()
+    _state['listener'] = listener
+
+
+def _stop():
+    listener = _state.pop('listener', None)
+    if listener is not None and _state.get('pid') == os.getpid():
+        listener.stop()
+    handler = _state.get('handler')
+    if handler is not None and handler.dropped:
+        sys.stderr.write(f"[AVISO] {handler.dropped} registro(s) de log descartado(s) com a fila cheia\n")
+        handler.dropped = 0
+
+
+def _after_fork():
+    handler = _state.get('handler')
+    if handler is None or 'listener' not in _state:
+        return
+    handler.queue = queue.Queue(maxsize=handler.queue.maxsize)
+    _state['pid'] = os.getpid()
+    _start()
+
+
+def stop_logging():
+    """Grava o que ainda está na fila e para a thread de escrita"""
+    with _lock:
+        _stop()
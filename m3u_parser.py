@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Leitura de playlists M3U em streaming
+Valida o cabeçalho #EXTM3U e conta os canais por blocos, com memória constante,
+opcionalmente analisa as entradas (grupos, tipos e amostra de streams) e calcula
+a impressão digital (hash) do conteúdo
+"""
+
+import codecs
+import hashlib
+import random
+import re
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+# Tamanho dos blocos lidos da resposta HTTP
+CHUNK_SIZE = 64 * 1024
+
+M3U_HEADER = b'#EXTM3U'
+
+# Linha de canal: "#EXTINF:" no início da linha (ignorando espaços)
+_EXTINF_LINE = re.compile(rb'^[ \t]*#EXTINF:', re.MULTILINE)
+
+# Quanto de uma linha incompleta é guardado entre blocos (só o início importa)
+_MAX_PENDING = 256
+
+# Quanto do início do arquivo é examinado para encontrar o cabeçalho
+_MAX_HEAD = 4096
+
+
+class M3UStreamCounter:
+    """Valida e conta canais de um M3U recebido em blocos de bytes"""
+
+    def __init__(self):
+        self.valid_header = None  # None enquanto o início do arquivo não chegou
+        self.total_channels = 0
+        self.bytes_read = 0
+        self._head = b''
+        self._pending = b''
+
+    def feed(self, chunk: bytes):
+        """Processa o próximo bloco da playlist"""
+        self.bytes_read += len(chunk)
+
+        if self.valid_header is None:
+            self._check_header(chunk)
+        if self.valid_header is False:
+            return
+
+        data = self._pending + chunk if self._pending else chunk
+        end = data.rfind(b'\n') + 1
+        if end:
+            self.total_channels += len(_EXTINF_LINE.findall(data, 0, end))
+
+        # Guarda só o começo da linha incompleta para o próximo bloco
+        self._pending = data[end:end + _MAX_PENDING]
+
+    def close(self):
+        """Finaliza a contagem (última linha sem quebra de linha)"""
+        if self.valid_header is None:
+            self._check_header(b'', final=True)
+        if self.valid_header and self._pending and _EXTINF_LINE.match(self._pending):
+            self.total_channels += 1
+        self._pending = b''
+        self._head = b''
+
+    def _check_header(self, chunk: bytes, final: bool = False):
+        if len(self._head) < _MAX_HEAD:
+            self._head += chunk[:_MAX_HEAD]
+
+        head = self._head
+        if head.startswith(codecs.BOM_UTF8):
+            head = head[len(codecs.BOM_UTF8):]
+        head = head.lstrip()
+
+        if len(head) >= len(M3U_HEADER):
+            self.valid_header = head.startswith(M3U_HEADER)
+        elif final or len(self._head) >= _MAX_HEAD:
+            self.valid_header = False
+
+        if self.valid_header is not None:
+            self._head = b''
+
+
+# Atributos do #EXTINF: chave="valor"
+_ATTRIBUTE = re.compile(r'([A-Za-z0-9_-]+)="([^"]*)"')
+
+# Linhas maiores que isso são descartadas (não são entradas válidas)
+_MAX_LINE = 64 * 1024
+
+# Tipos de entrada, pelo caminho da URL do stream Xtream Codes
+LIVE = 'live'
+VOD = 'vod'
+SERIES = 'series'
+
+SEM_GRUPO = 'Sem grupo'
+
+
+class M3UEntry(NamedTuple):
+    duration: str
+    attributes: Dict[str, str]
+    title: str
+    url: str
+
+    @property
+    def group(self) -> str:
+        return self.attributes.get('group-title') or SEM_GRUPO
+
+    @property
+    def kind(self) -> str:
+        path = self.url.lower()
+        if '/movie/' in path:
+            return VOD
+        if '/series/' in path:
+            return SERIES
+        return LIVE
+
+
+def parse_extinf(line: str) -> M3UEntry:
+    """Interpreta uma linha #EXTINF (a URL é preenchida depois)"""
+    body = line.strip()[len('#EXTINF:'):]
+    # O título vem depois da primeira vírgula fora de aspas
+    last_quote = body.rfind('"')
+    comma = body.find(',', last_quote + 1 if last_quote != -1 else 0)
+    info, title = (body[:comma], body[comma + 1:]) if comma != -1 else (body, '')
+    duration = info.split(' ', 1)[0]
+    return M3UEntry(duration, dict(_ATTRIBUTE.findall(info)), title.strip(), '')
+
+
+class M3UEntryParser:
+    """Gera as entradas (#EXTINF + URL) de um M3U recebido em blocos de bytes"""
+
+    def __init__(self):
+        self._pending = b''
+        self._entry: Optional[M3UEntry] = None
+        self._group = ''
+
+    def feed(self, chunk: bytes) -> Iterator[M3UEntry]:
+        data = self._pending + chunk if self._pending else chunk
+        end = data.rfind(b'\n') + 1
+        self._pending = data[end:]
+        if len(self._pending) > _MAX_LINE:
+            self._pending = b''
+        if end:
+            for raw in data[:end].split(b'\n'):
+                yield from self._line(raw)
+
+    def close(self) -> Iterator[M3UEntry]:
+        if self._pending:
+            yield from self._line(self._pending)
+        self._pending = b''
+        self._entry = None
+
+    def _line(self, raw: bytes) -> Iterator[M3UEntry]:
+        line = raw.strip()
+        if not line:
+            return
+        if line.startswith(b'#'):
+            if line.startswith(b'#EXTINF:'):
+                self._entry = parse_extinf(line.decode('utf-8', 'replace'))
+                self._group = ''
+            elif line.startswith(b'#EXTGRP:'):
+                self._group = line[8:].decode('utf-8', 'replace').strip()
+            return
+        if self._entry is not None:
+            entry = self._entry._replace(url=line.decode('utf-8', 'replace'))
+            if self._group and 'group-title' not in entry.attributes:
+                entry.attributes['group-title'] = self._group
+            self._entry = None
+            yield entry
+
+
+class PlaylistStats:
+    """
+    Resumo compacto da playlist: contagem por grupo e por tipo, com uma
+    amostra aleatória (reservoir sampling) das URLs dos streams
+    """
+
+    def __init__(self, sample_size: int = 0, max_groups: int = 1000, rng: Optional[random.Random] = None):
+        self.sample_size = sample_size
+        self.max_groups = max_groups
+        self.rng = rng or random.Random()
+        self.total = 0
+        self.kinds = {LIVE: 0, VOD: 0, SERIES: 0}
+        self.groups: Dict[str, Dict[str, int]] = {}
+        self.sample: List[str] = []
+
+    def add(self, entry: M3UEntry):
+        self.total += 1
+        kind = entry.kind
+        self.kinds[kind] += 1
+
+        group = entry.group
+        counts = self.groups.get(group)
+        if counts is None:
+            if len(self.groups) >= self.max_groups:
+                # Playlists com grupos demais: o excedente é somado em um só
+                group = 'Outros'
+                counts = self.groups.get(group)
+            if counts is None:
+                counts = self.groups[group] = {LIVE: 0, VOD: 0, SERIES: 0}
+        counts[kind] += 1
+
+        if self.sample_size:
+            if len(self.sample) < self.sample_size:
+                self.sample.append(entry.url)
+            else:
+                index = self.rng.randrange(self.total)
+                if index < self.sample_size:
+                    self.sample[index] = entry.url
+
+    def top_groups(self, limit: int = 10) -> Dict[str, Dict[str, int]]:
+        """Os maiores grupos, do maior para o menor"""
+        ordered = sorted(self.groups.items(), key=lambda item: sum(item[1].values()), reverse=True)
+        return dict(ordered[:limit])
+
+
+# Esquema e servidor de qualquer URL da playlist (streams e logos)
+_URL_ORIGIN = re.compile(rb'[A-Za-z][A-Za-z0-9+.-]*://[^/\s"]+')
+
+
+class PlaylistFingerprint:
+    """
+    Hash do conteúdo de um M3U recebido em blocos, sem servidor e credenciais
+
+    Revendas do mesmo painel entregam a mesma playlist com o próprio servidor e
+    usuário/senha nas URLs dos streams; eles são removidos antes do hash para que
+    a mesma lista tenha a mesma impressão em qualquer revenda. O hash dos
+    primeiros `prefix_size` bytes (já normalizados) fica em `prefix` assim que
+    eles chegam, para reconhecer uma lista conhecida sem baixá-la inteira.
+    """
+
+    def __init__(self, username: str = '', password: str = '', prefix_size: int = 256 * 1024):
+        self.prefix_size = prefix_size
+        self.prefix: Optional[str] = None
+        self.size = 0
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._prefix = hashlib.blake2b(digest_size=16)
+        self._pending = b''
+        self._replacements = []
+        if username and password:
+            user, password = username.encode('utf-8'), password.encode('utf-8')
+            self._replacements = [
+                (b'/' + user + b'/' + password + b'/', b'/'),
+                (b'username=' + user, b'username='),
+                (b'password=' + password, b'password=')
+            ]
+
+    def feed(self, chunk: bytes):
+        """Processa o próximo bloco (só linhas completas entram no hash)"""
+        data = self._pending + chunk if self._pending else chunk
+        end = data.rfind(b'\n') + 1
+        self._pending = data[end:]
+        if end:
+            self._update(data[:end])
+        if len(self._pending) > _MAX_LINE:
+            self._update(self._pending)
+            self._pending = b''
+
+    def close(self) -> str:
+        """Finaliza e retorna a impressão da playlist inteira"""
+        if self._pending:
+            self._update(self._pending)
+            self._pending = b''
+        return self._hash.hexdigest()
+
+    def _update(self, data: bytes):
+        data = _URL_ORIGIN.sub(b'//', data).replace(b'\r\n', b'\n')
+        for old, new in self._replacements:
+            data = data.replace(old, new)
+        if self.prefix is None and self.prefix_size:
+            room = self.prefix_size - self.size
+            self._prefix.update(data[:room])
+            if len(data) >= room:
+                self.prefix = self._prefix.hexdigest()
+        self._hash.update(data)
+        self.size += len(data)
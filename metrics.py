@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Métricas do bot: latência por etapa, contadores de resultados e gauges
+Expostas em formato Prometheus num endpoint HTTP local e, opcionalmente,
+em snapshots JSON periódicos
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Limites (segundos) dos buckets dos histogramas de latência
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(key: LabelKey, extra: str = '') -> str:
+    parts = []
+    for name, value in key:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Histogram:
+    """Histograma de buckets fixos (cumulativo na exportação, como no Prometheus)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimativa do quantil pelo limite superior do bucket"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        acumulado = 0
+        for index, count in enumerate(self.counts):
+            acumulado += count
+            if acumulado >= target:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+
+class Metrics:
+    """Registro de métricas em memória (usado apenas pelo event loop do bot)"""
+
+    def __init__(self, prefix: str = 'iptv_bot', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.started_at = time.time()
+        self._histograms: Dict[LabelKey, Histogram] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._help: Dict[str, str] = {}
+
+    # Coleta
+
+    def observe(self, etapa: str, seconds: float):
+        key = _label_key({'etapa': etapa})
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    @contextmanager
+    def stage(self, etapa: str):
+        """Mede a duração de uma etapa e conta as execuções em andamento"""
+        self._in_flight[etapa] = self._in_flight.get(etapa, 0) + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._in_flight[etapa] -= 1
+            self.observe(etapa, time.perf_counter() - start)
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1, help: str = ''):
+        series = self._counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+        if help:
+            self._help.setdefault(name, help)
+
+    def gauge(self, name: str, func: Callable[[], float], help: str = ''):
+        """Registra um gauge lido no momento da exportação"""
+        self._gauges[name] = func
+        if help:
+            self._help[name] = help
+
+    # Exportação
+
+    def _gauge_values(self) -> Dict[str, float]:
+        values = {}
+        for name, func in self._gauges.items():
+            try:
+                values[name] = float(func())
+            except Exception as e:
+                logger.debug(f"Gauge {name} indisponível: {e!r}")
+        return values
+
+    def render(self) -> str:
+        """Texto no formato de exposição do Prometheus"""
+        p = self.prefix
+        lines = [
+            f'# HELP {p}_etapa_segundos Duração de cada etapa do processamento',
+            f'# TYPE {p}_etapa_segundos histogram'
+        ]
+        for key, histogram in sorted(self._histograms.items()):
+            acumulado = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                acumulado += count
+                labels = _format_labels(key, 'le="%s"' % bound)
+                lines.append(f'{p}_etapa_segundos_bucket{labels} {acumulado}')
+            labels = _format_labels(key, 'le="+Inf"')
+            lines.append(f'{p}_etapa_segundos_bucket{labels} {histogram.count}')
+            lines.append(f'{p}_etapa_segundos_sum{_format_labels(key)} {histogram.sum}')
+            lines.append(f'{p}_etapa_segundos_count{_format_labels(key)} {histogram.count}')
+
+        for name, series in sorted(self._counters.items()):
+            if name in self._help:
+                lines.append(f'# HELP {p}_{name} {self._help[name]}')
+            lines.append(f'# TYPE {p}_{name} counter')
+            for key, value in sorted(series.items()):
+                lines.append(f'{p}_{name}{_format_labels(key)} {value:g}')
+
+        lines.append(f'# HELP {p}_em_andamento Execuções de cada etapa em andamento')
+        lines.append(f'# TYPE {p}_em_andamento gauge')
+        for etapa, value in sorted(self._in_flight.items()):
+            labels = _format_labels(_label_key({'etapa': etapa}))
+            lines.append(f'{p}_em_andamento{labels} {value}')
+
+        for name, value in sorted(self._gauge_values().items()):
+            if name in self._help:
+                lines.append(f'# HELP {p}_{name} {self._help[name]}')
+            lines.append(f'# TYPE {p}_{name} gauge')
+            lines.append(f'{p}_{name} {value:g}')
+
+        lines.append(f'# TYPE {p}_uptime_segundos gauge')
+        lines.append(f'{p}_uptime_segundos {time.time() - self.started_at:.0f}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict:
+        """Resumo das métricas em um dicionário serializável em JSON"""
+        return {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'uptime_segundos': round(time.time() - self.started_at),
+            'etapas': {
+                dict(key)['etapa']: {
+                    'total': histogram.count,
+                    'media': histogram.sum / histogram.count if histogram.count else 0.0,
+                    'p50': histogram.quantile(0.5),
+                    'p99': histogram.quantile(0.99),
+                    'em_andamento': self._in_flight.get(dict(key)['etapa'], 0)
+                }
+                for key, histogram in sorted(self._histograms.items())
+            },
+            'contadores': {
+                name: [dict(key, valor=value) for key, value in sorted(series.items())]
+                for name, series in sorted(self._counters.items())
+            },
+            'gauges': self._gauge_values()
+        }
+
+    def write_snapshot(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+class MetricsExporter:
+    """Endpoint HTTP /metrics (e /metrics.json) e snapshots JSON periódicos"""
+
+    def __init__(self, metrics: Metrics, host: str = '127.0.0.1', port: int = 9108,
+                 snapshot_path: str = '', snapshot_interval: float = 60.0):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._runner: Optional[web.AppRunner] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _handle_metrics(self, request):
+        return web.Response(text=self.metrics.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def _handle_json(self, request):
+        return web.json_response(self.metrics.snapshot(), dumps=lambda d: json.dumps(d, ensure_ascii=False))
+
+    async def start(self):
+        """Inicia o endpoint e os snapshots no event loop atual (idempotente)"""
+        if self.port and self._runner is None:
+            app = web.Application()
+            app.router.add_get('/metrics', self._handle_metrics)
+            app.router.add_get('/metrics.json', self._handle_json)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            try:
+                await web.TCPSite(runner, self.host, self.port).start()
+            except OSError as e:
+                await runner.cleanup()
+                logger.error(f"Não foi possível abrir o endpoint de métricas em {self.host}:{self.port}: {str(e)}")
+            else:
+                self._runner = runner
+                logger.info(f"Métricas disponíveis em http://{self.host}:{self.port}/metrics")
+
+        if self.snapshot_path and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._snapshots())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._write_snapshot()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _write_snapshot(self):
+        try:
+            self.metrics.write_snapshot(self.snapshot_path)
+        except OSError as e:
+            logger.error(f"Erro ao gravar snapshot de métricas: {str(e)}")
+
+    async def _snapshots(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            self._write_snapshot()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Limite de taxa das requisições aos servidores IPTV
+Token bucket global e por servidor (host:porta), aplicado pelo cliente HTTP
+antes de cada requisição
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Balde de fichas: `rate` requisições por segundo com rajadas de até `burst`
+
+    As fichas são reservadas na chamada (o saldo pode ficar negativo): cada
+    requisição espera o tempo até a sua ficha existir, na ordem de chegada.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Consome uma ficha e retorna quantos segundos esperar por ela"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RequestLimiter:
+    """
+    Limites de requisições por segundo no total e por servidor (0 desativa cada um)
+
+    Os baldes por servidor ficam em um LRU de até `max_servers` entradas.
+    """
+
+    def __init__(self, rate: float = 0.0, per_server_rate: float = 0.0, burst: float = 5.0,
+                 max_servers: int = 10000):
+        self.per_server_rate = per_server_rate
+        self.burst = burst
+        self.max_servers = max_servers
+        self.delayed = 0
+        self._global: Optional[TokenBucket] = TokenBucket(rate, burst) if rate > 0 else None
+        self._servers: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self._global is not None or self.per_server_rate > 0
+
+    def _server(self, key: str) -> TokenBucket:
+        bucket = self._servers.get(key)
+        if bucket is None:
+            bucket = self._servers[key] = TokenBucket(self.per_server_rate, self.burst)
+            if len(self._servers) > self.max_servers:
+                self._servers.popitem(last=False)
+        else:
+            self._servers.move_to_end(key)
+        return bucket
+
+    async def acquire(self, key: str):
+        """Aguarda até a requisição ao servidor `key` caber nos dois limites"""
+        wait = 0.0
+        if self._global is not None:
+            wait = self._global.reserve()
+        if self.per_server_rate > 0:
+            wait = max(wait, self._server(key).reserve())
+        if wait > 0:
+            self.delayed += 1
+            await asyncio.sleep(wait)
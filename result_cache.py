@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache persistente de links e contas já testados
+Evita novo download, consulta à API, linha no CSV e webhook quando uma lista é repostada
+"""
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_url(url: str) -> str:
+    """Normaliza uma URL para comparação (esquema/host minúsculos, sem porta padrão, query ordenada)"""
+    try:
+        parsed = urlparse(url.strip())
+        scheme = (parsed.scheme or 'http').lower()
+        host = (parsed.hostname or '').lower()
+        port = parsed.port
+    except ValueError:
+        return url.strip()
+
+    netloc = host
+    if port and port != (443 if scheme == 'https' else 80):
+        netloc = f"{host}:{port}"
+
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, netloc, parsed.path or '/', parsed.params, query, ''))
+
+
+def url_key(url: str) -> str:
+    """Chave do cache para um link"""
+    return f"url:{normalize_url(url)}"
+
+
+def account_key(server: str, port, username: str) -> str:
+    """Chave do cache para uma conta (servidor, porta, username)"""
+    return f"conta:{(server or '').lower()}:{port}:{username}"
+
+
+class ResultCache:
+    """Cache LRU com expiração (TTL), salvo em um arquivo JSON"""
+
+    def __init__(self, path: str, ttl: int = 21600, max_items: int = 10000, flush_interval: int = 30):
+        self.path = path
+        self.ttl = ttl
+        self.max_items = max_items
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self._items: 'OrderedDict[str, list]' = OrderedDict()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self.load()
+
+    def load(self):
+        """Carrega o cache do disco, descartando entradas vencidas"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Erro ao carregar cache {self.path}: {str(e)}")
+            return
+
+        now = time.time()
+        for key, (expires_at, value) in data.items():
+            if expires_at > now:
+                self._items[key] = [expires_at, value]
+        self._evict()
+        logger.info(f"Cache carregado: {len(self._items)} entradas de {self.path}")
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Retorna o valor em cache, ou None se ausente ou vencido"""
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        if item[0] <= time.time():
+            del self._items[key]
+            self._dirty = True
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def get_any(self, keys: Iterable[str]) -> Optional[Dict]:
+        """Retorna o primeiro valor em cache entre as chaves informadas"""
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                return value
+        return None
+
+    def put(self, keys: Iterable[str], value: Dict, ttl: Optional[int] = None):
+        """Guarda o mesmo valor sob várias chaves"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        for key in keys:
+            self._items[key] = [expires_at, value]
+            self._items.move_to_end(key)
+        self._evict()
+        self._dirty = True
+        self.maybe_save()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _evict(self):
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def maybe_save(self):
+        """Salva se houver alterações e o intervalo mínimo tiver passado"""
+        if self._dirty and time.monotonic() - self._last_save >= self.flush_interval:
+            self.save()
+
+    def save(self):
+        """Grava o cache em disco de forma atômica"""
+        if not self.path or not self._dirty:
+            return
+        now = time.time()
+        data = {key: item for key, item in self._items.items() if item[0] > now}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except OSError as e:
+            logger.error(f"Erro ao salvar cache {self.path}: {str(e)}")
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Revalidação periódica das listas IPTV salvas
+Consulta novamente a API Xtream Codes das contas armazenadas, priorizando as
+que vencem primeiro e as testadas há mais tempo, e atualiza status e data_teste
+
+Uso:
+    python revalidation.py              # uma passada e sai
+    python revalidation.py --continuo   # revalida a cada REVALIDACAO_INTERVALO segundos
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from rate_limit import RequestLimiter
+from worker_pool import server_key
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Status gravados quando a API não confirma a conta
+STATUS_OFFLINE = 'Offline'
+STATUS_RECUSADA = 'Recusada'
+
+
+def _parse_date(value: str) -> Optional[float]:
+    try:
+        return datetime.strptime(value, DATE_FORMAT).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class Revalidator:
+    """
+    Revalida contas armazenadas em lotes limitados por taxa
+
+    Dentro de cada lote as contas são agrupadas por servidor (host:porta): cada
+    painel é consultado em sequência, reaproveitando a conexão keep-alive do
+    cliente HTTP, enquanto painéis diferentes são consultados em paralelo.
+    """
+
+    def __init__(self, api, store, batch_size: int = 100, rate: float = 5.0,
+                 max_servers: int = 10, min_age: float = 21600, metrics=None, index=None):
+        self.api = api
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.rate = rate
+        self.max_servers = max(1, max_servers)
+        self.min_age = min_age
+        self.metrics = metrics
+        self.index = index
+        self._task: Optional[asyncio.Task] = None
+
+    def select(self, rows: List[Dict], limit: int = 0, todas: bool = False) -> List[Dict]:
+        """
+        Contas a revalidar, na ordem de prioridade
+
+        Contas ainda não vencidas vêm primeiro, da que vence antes para a que vence
+        depois (sem data de vencimento no fim); as já vencidas vêm em seguida.
+        Empates são resolvidos pelo teste mais antigo.
+        """
+        now = time.time()
+        accounts = OrderedDict()
+        for row in rows:
+            if row.get('servidor') and row.get('username') and row.get('link_m3u'):
+                # No CSV append-only a mesma conta pode aparecer várias vezes: vale a última
+                accounts[(row['servidor'], row['username'])] = row
+
+        selected = []
+        for row in accounts.values():
+            tested = _parse_date(row.get('data_teste', '')) or 0.0
+            if not todas and now - tested < self.min_age:
+                continue
+            expires = _parse_date(row.get('data_vencimento', ''))
+            if expires is None:
+                priority = (0, float('inf'), tested)
+            elif expires >= now:
+                priority = (0, expires, tested)
+            else:
+                priority = (1, tested, expires)
+            selected.append((priority, row))
+
+        selected.sort(key=lambda item: item[0])
+        rows = [row for _, row in selected]
+        return rows[:limit] if limit else rows
+
+    async def _check(self, row: Dict, limiter: RequestLimiter) -> Dict:
+        credentials = self.api.extract_credentials(row['link_m3u']) or {}
+        await limiter.acquire(server_key(row['link_m3u']))
+
+        start = time.perf_counter()
+        account_info = await self.api.get_account_info(
+            server=row['servidor'],
+            port=row.get('porta') or credentials.get('port', 80),
+            username=row['username'],
+            password=row.get('password') or credentials.get('password', ''),
+            scheme=credentials.get('scheme', 'http')
+        )
+
+        # Só os campos revalidados: o restante da linha pode ter sido salvo de novo
+        # pelo pipeline durante a passada e não deve voltar ao valor lido no início
+        updated = {
+            'servidor': row['servidor'],
+            'username': row['username'],
+            'data_teste': datetime.now().strftime(DATE_FORMAT)
+        }
+        if account_info is None:
+            updated['status'] = STATUS_OFFLINE
+        elif str(account_info.get('auth', 1)) == '0':
+            updated['status'] = STATUS_RECUSADA
+        else:
+            motivo = self.api.check_account(account_info)
+            status = str(account_info.get('status', 'unknown'))
+            # Conta "Active" com data de vencimento no passado
+            updated['status'] = 'Expired' if motivo and status.lower() == 'active' else status
+            if account_info.get('exp_date_formatted', 'N/A') != 'N/A':
+                updated['data_vencimento'] = account_info['exp_date_formatted']
+
+        if self.metrics is not None:
+            self.metrics.observe('revalidacao', time.perf_counter() - start)
+            self.metrics.inc('revalidacoes_total', {'status': updated['status']},
+                             help='Contas revalidadas por status resultante')
+        return updated
+
+    async def _check_server(self, rows: List[Dict], limiter: RequestLimiter,
+                            semaphore: asyncio.Semaphore) -> List[Dict]:
+        async with semaphore:
+            return [await self._check(row, limiter) for row in rows]
+
+    async def run_once(self, limit: int = 0, todas: bool = False) -> Dict[str, int]:
+        """
+        Executa uma passada completa de revalidação
+
+        Os resultados são gravados de uma vez no fim da passada (ou quando ela é
+        interrompida), fora do event loop: no CSV cada gravação reescreve o arquivo.
+        Só status, data_vencimento e data_teste são gravados.
+
+        Returns:
+            Número de contas por status resultante
+        """
+        loop = asyncio.get_running_loop()
+        stored = await loop.run_in_executor(None, self.store.load_rows)
+        rows = self.select(stored, limit=limit, todas=todas)
+        stats: Dict[str, int] = {}
+        if not rows:
+            logger.info("Revalidação: nenhuma conta pendente")
+            return stats
+
+        logger.info(f"Revalidação: {len(rows)} conta(s) a verificar")
+        # Sem rajada: as consultas da passada ficam espaçadas de 1/rate segundos
+        limiter = RequestLimiter(rate=self.rate, burst=1)
+        semaphore = asyncio.Semaphore(self.max_servers)
+
+        updated: List[Dict] = []
+        try:
+            for offset in range(0, len(rows), self.batch_size):
+                batch = rows[offset:offset + self.batch_size]
+                servers = OrderedDict()
+                for row in batch:
+                    servers.setdefault(server_key(row['link_m3u']), []).append(row)
+
+                results = await asyncio.gather(
+                    *(self._check_server(group, limiter, semaphore) for group in servers.values())
+                )
+                for group in results:
+                    for row in group:
+                        updated.append(row)
+                        stats[row['status']] = stats.get(row['status'], 0) + 1
+                logger.info(f"Revalidação: {offset + len(batch)}/{len(rows)} conta(s) verificada(s)")
+        finally:
+            if updated:
+                await loop.run_in_executor(None, self.store.update_many, updated)
+                if self.index is not None:
+                    self.index.update_many(updated)
+
+        logger.info(f"Revalidação concluída: {stats}")
+        return stats
+
+    def start(self, interval: float):
+        """Revalida em background a cada `interval` segundos (idempotente)"""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self, interval: float):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro na revalidação: {e!r}")
+            await asyncio.sleep(interval)
+
+
+async def _cli(args):
+    # Reaproveita configuração, cliente da API e armazenamento do bot
+    import telegram_iptv_bot as bot
+
+    app = bot.app
+    config = bot.carregar_configuracao()
+    revalidator = Revalidator(
+        app.xtream_api,
+        app.store,
+        batch_size=config.revalidacao_lote,
+        rate=config.revalidacao_por_segundo,
+        max_servers=config.revalidacao_simultaneas,
+        min_age=config.revalidacao_idade_min
+    )
+    try:
+        if args.continuo:
+            await revalidator._run(config.revalidacao_intervalo)
+        else:
+            stats = await revalidator.run_once(limit=args.limite, todas=args.todas)
+            total = sum(stats.values())
+            print(f"[OK] {total} conta(s) revalidada(s)")
+            for status, count in sorted(stats.items()):
+                print(f"  • {status}: {count}")
+    finally:
+        await revalidator.stop()
+        await bot.fechar_conexoes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Revalida as listas IPTV salvas')
+    parser.add_argument('--limite', type=int, default=0, help='Máximo de contas nesta passada')
+    parser.add_argument('--todas', action='store_true', help='Ignora REVALIDACAO_IDADE_MIN')
+    parser.add_argument('--continuo', action='store_true', help='Revalida a cada REVALIDACAO_INTERVALO segundos')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_cli(args))
+    except KeyboardInterrupt:
+        print("\n[INFO] Revalidação interrompida pelo usuário")
+
+
+if __name__ == '__main__':
+    main()
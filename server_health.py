@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Saúde dos servidores IPTV por host:porta
+Circuit breaker (falha rápida para painéis fora do ar, com sonda half-open)
+e timeouts de conexão adaptativos calculados a partir da latência observada
+"""
+
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'fechado'
+OPEN = 'aberto'
+HALF_OPEN = 'meio-aberto'
+
+
+class CircuitOpenError(aiohttp.ClientConnectionError):
+    """Requisição recusada localmente: o circuito do servidor está aberto"""
+
+    def __init__(self, key: str, retry_in: float):
+        super().__init__(f"Servidor {key} indisponível (circuito aberto, nova tentativa em {retry_in:.0f}s)")
+        self.key = key
+        self.retry_in = retry_in
+
+
+class _Server:
+    __slots__ = ('results', 'state', 'opened_at', 'cooldown', 'probing', 'latency', 'deviation', 'samples')
+
+    def __init__(self, window: int):
+        self.results = deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.cooldown = 0.0
+        self.probing = False
+        self.latency = 0.0
+        self.deviation = 0.0
+        self.samples = 0
+
+
+class ServerHealth:
+    """
+    Estado de cada servidor (host:porta) visto pelos clientes HTTP
+
+    O circuito abre quando a taxa de falhas nas últimas `window` requisições
+    passa de `failure_rate` (com pelo menos `min_requests` amostras). Depois de
+    `cooldown` segundos uma única requisição de sonda é liberada: se funcionar
+    o circuito fecha, senão reabre com o dobro da espera (até `max_cooldown`).
+    """
+
+    def __init__(self, failure_rate: float = 0.5, min_requests: int = 3, window: int = 20,
+                 cooldown: float = 30.0, max_cooldown: float = 600.0, adaptive: bool = True,
+                 min_timeout: float = 3.0, max_servers: int = 10000):
+        self.failure_rate = failure_rate
+        self.min_requests = max(1, min_requests)
+        self.window = max(self.min_requests, window)
+        self.base_cooldown = cooldown
+        self.max_cooldown = max(cooldown, max_cooldown)
+        self.adaptive = adaptive
+        self.min_timeout = min_timeout
+        self.max_servers = max_servers
+        self._servers: 'OrderedDict[str, _Server]' = OrderedDict()
+
+    def _get(self, key: str) -> _Server:
+        server = self._servers.get(key)
+        if server is None:
+            server = self._servers[key] = _Server(self.window)
+            if len(self._servers) > self.max_servers:
+                self._servers.popitem(last=False)
+        else:
+            self._servers.move_to_end(key)
+        return server
+
+    def allow(self, key: str):
+        """Libera a requisição ou levanta CircuitOpenError"""
+        server = self._servers.get(key)
+        if server is None or server.state == CLOSED:
+            return
+        remaining = server.opened_at + server.cooldown - time.monotonic()
+        if server.state == OPEN and remaining <= 0:
+            server.state = HALF_OPEN
+        if server.state == HALF_OPEN and not server.probing:
+            # Sonda: uma única requisição para ver se o servidor voltou
+            server.probing = True
+            logger.info(f"Circuito de {key}: testando se o servidor voltou")
+            return
+        raise CircuitOpenError(key, max(0.0, remaining))
+
+    def timeout_for(self, key: str, default: float) -> float:
+        """
+        Timeout de conexão para o servidor, ajustado pela latência observada
+
+        A latência é medida até os cabeçalhos, por host:porta, e mistura
+        endpoints rápidos (player_api) com lentos (get.php, listagens): o valor
+        serve para desistir cedo de conectar, não como limite de leitura.
+        """
+        server = self._servers.get(key)
+        if not self.adaptive or server is None or server.samples < 3:
+            return default
+        # Margem generosa sobre a média móvel (EWMA) e o desvio da latência
+        estimate = 3 * server.latency + 4 * server.deviation
+        return min(default, max(self.min_timeout, estimate))
+
+    def record(self, key: str, ok: bool, latency: Optional[float] = None):
+        """Registra o resultado de uma requisição (latency: tempo até os cabeçalhos)"""
+        server = self._get(key)
+        server.results.append(ok)
+
+        if ok and latency is not None:
+            if server.samples:
+                error = latency - server.latency
+                server.latency += 0.2 * error
+                server.deviation += 0.2 * (abs(error) - server.deviation)
+            else:
+                server.latency = latency
+                server.deviation = latency / 2
+            server.samples += 1
+
+        if server.state == HALF_OPEN and server.probing:
+            server.probing = False
+            if ok:
+                logger.info(f"Circuito de {key} fechado: servidor respondeu")
+                server.state = CLOSED
+                server.cooldown = 0.0
+                server.results.clear()
+                server.results.append(True)
+            else:
+                self._open(key, server, min(self.max_cooldown, server.cooldown * 2))
+            return
+
+        if server.state == CLOSED and len(server.results) >= self.min_requests:
+            failures = server.results.count(False)
+            if failures / len(server.results) >= self.failure_rate:
+                self._open(key, server, self.base_cooldown)
+
+    def _open(self, key: str, server: _Server, cooldown: float):
+        server.state = OPEN
+        server.opened_at = time.monotonic()
+        server.cooldown = cooldown
+        logger.warning(f"Circuito de {key} aberto por {cooldown:.0f}s (muitas falhas)")
+
+    def cancel(self, key: str):
+        """A requisição terminou sem resultado (cancelada): libera uma nova sonda"""
+        server = self._servers.get(key)
+        if server is not None and server.state == HALF_OPEN:
+            server.probing = False
+
+    def state(self, key: str) -> str:
+        server = self._servers.get(key)
+        return server.state if server else CLOSED
+
+    def open_count(self) -> int:
+        """Servidores com o circuito aberto ou em teste"""
+        return sum(1 for server in self._servers.values() if server.state != CLOSED)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Execução do bot em vários processos
+Um processo de ingestão recebe as mensagens do Telegram (sessão única
+session_iptv_bot) e distribui os links por servidor entre N processos de teste;
+os resultados voltam para um único processo escritor, dono do armazenamento,
+do webhook, da revalidação e da API de contas
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from log_setup import stop_logging
+from worker_pool import server_key
+
+logger = logging.getLogger(__name__)
+
+# Mensagens da fila de resultados: (tipo, dados)
+LINHA = 'linha'
+WEBHOOK = 'webhook'
+
+
+def shard_for(m3u_url: str, shards: int) -> int:
+    """Processo de teste responsável pelo servidor (host:porta) do link"""
+    return zlib.crc32(server_key(m3u_url).encode('utf-8')) % shards
+
+
+def shard_path(path: str, index: int) -> str:
+    """Arquivo próprio de cada processo de teste (ex.: cache_links.1.json)"""
+    if not path:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.{index}{ext}"
+
+
+class ShardRouter:
+    """
+    Substitui o pool de testes no processo de ingestão
+
+    Mesma interface do WorkerPool: os links de um mesmo servidor vão sempre para o
+    mesmo processo, o que mantém o limite por servidor, o circuit breaker e o cache
+    de resultados coerentes sem compartilhar estado entre processos.
+    """
+
+    def __init__(self, queues: List[multiprocessing.Queue], processes: List[multiprocessing.Process]):
+        self.queues = queues
+        self.processes = processes
+        self.active = 0
+
+    async def submit(self, job: Dict):
+        """Envia o job ao processo do servidor; aguarda (backpressure) se a fila dele estiver cheia"""
+        index = shard_for(job['m3u_url'], len(self.queues))
+        if not self.processes[index].is_alive():
+            logger.error(f"Processo de teste {index} parou (código {self.processes[index].exitcode}), "
+                         f"link descartado: {job['m3u_url'][:80]}")
+            return
+        try:
+            self.queues[index].put_nowait(job)
+        except queue.Full:
+            logger.warning(f"Fila do processo de teste {index} cheia, aguardando espaço...")
+            await asyncio.get_running_loop().run_in_executor(None, self.queues[index].put, job)
+
+    def qsize(self) -> int:
+        return sum(q.qsize() for q in self.queues)
+
+    async def join(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class QueueStore:
+    """Armazenamento dos processos de teste: envia as linhas para o processo escritor"""
+
+    def __init__(self, results: multiprocessing.Queue, nome: str):
+        self.results = results
+        self.nome = nome
+
+    def save(self, row: Dict):
+        self.results.put((LINHA, row))
+
+    def save_many(self, rows):
+        for row in rows:
+            self.save(row)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class QueueDispatcher:
+    """Webhook dos processos de teste: envia os eventos para o processo escritor"""
+
+    def __init__(self, results: multiprocessing.Queue):
+        self.results = results
+
+    def enqueue(self, payload: Dict):
+        self.results.put((WEBHOOK, payload))
+
+    def pending(self) -> int:
+        return self.results.qsize()
+
+    def start(self):
+        pass
+
+    async def stop(self, timeout: float = 0):
+        pass
+
+
+def _ignore_sigint():
+    # Ctrl+C chega a todo o grupo de processos: quem coordena o encerramento é a ingestão
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _own_files(config, offset: int):
+    """Porta de métricas, snapshot e cache próprios de cada processo"""
+    if config.metricas_porta:
+        config.metricas_porta += offset
+    config.metricas_snapshot = shard_path(config.metricas_snapshot, offset)
+    config.cache_arquivo = shard_path(config.cache_arquivo, offset - 1)
+
+
+def _worker_main(bot, index: int, jobs: multiprocessing.Queue, results: multiprocessing.Queue,
+                 stopping: multiprocessing.Event):
+    """Processo de teste: valida os links recebidos com o pool de workers do bot"""
+    _ignore_sigint()
+    app = bot.app
+    _own_files(app.config, index + 1)
+    # Os componentes são criados sob demanda neste processo; linhas e webhook vão para o escritor
+    app.store = QueueStore(results, 'SQLite' if app.config.armazenamento == 'sqlite' else 'CSV')
+    if app.config.webhook_url:
+        app.webhook_dispatcher = QueueDispatcher(results)
+    app.revalidator = None
+    app.accounts_index = None
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        await app.metrics_exporter.start()
+        app.link_pool.start()
+        try:
+            while not stopping.is_set():
+                try:
+                    job = await loop.run_in_executor(None, jobs.get, True, 1.0)
+                except queue.Empty:
+                    continue
+                if job is None:
+                    break
+                await app.link_pool.submit(job)
+        finally:
+            await bot.fechar_conexoes()
+
+    try:
+        asyncio.run(run())
+    finally:
+        # O processo filho termina sem atexit: grava o que ficou na fila de logs
+        stop_logging()
+
+
+def _writer_main(bot, shards: int, results: multiprocessing.Queue):
+    """Processo escritor: grava as linhas, entrega os eventos do webhook e serve a API de contas"""
+    _ignore_sigint()
+    app = bot.app
+    _own_files(app.config, shards + 1)
+    app.result_cache = None
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        await app.metrics_exporter.start()
+        if app.accounts_api is not None:
+            await app.accounts_api.start()
+        if app.webhook_dispatcher:
+            app.webhook_dispatcher.start()
+        if app.revalidator is not None:
+            app.revalidator.start(app.config.revalidacao_intervalo)
+        try:
+            while True:
+                message = await loop.run_in_executor(None, results.get)
+                if message is None:
+                    break
+                tipo, dados = message
+                if tipo == LINHA:
+                    with app.metrics.stage('armazenamento'):
+                        try:
+                            bot.salvar_linha(dados)
+                        except Exception as e:
+                            logger.error(f"Erro ao salvar no {app.store.nome}: {str(e)}")
+                elif tipo == WEBHOOK and app.webhook_dispatcher:
+                    app.webhook_dispatcher.enqueue(dados)
+        finally:
+            if app.webhook_dispatcher:
+                # Eventos não entregues continuam no spool para a próxima execução
+                await app.webhook_dispatcher.stop()
+            await bot.fechar_conexoes()
+
+    try:
+        asyncio.run(run())
+    finally:
+        stop_logging()
+
+
+class ShardedPipeline:
+    """
+    Processos de teste e escritor do modo PROCESSOS_TESTE > 1
+
+    Os processos são criados por fork a partir do módulo do bot já configurado,
+    antes de o cliente do Telegram conectar e antes de o armazenamento e os pools
+    HTTP serem criados: cada processo monta os próprios componentes (app.*) sob
+    demanda, em seu próprio event loop.
+    """
+
+    def __init__(self, bot, shards: int, queue_size: int = 500):
+        self.bot = bot
+        self.shards = max(1, shards)
+        self.queue_size = queue_size
+        self._context = multiprocessing.get_context('fork')
+        self._stopping = self._context.Event()
+        self.results: Optional[multiprocessing.Queue] = None
+        self.queues: List[multiprocessing.Queue] = []
+        self.workers: List[multiprocessing.Process] = []
+        self.writer: Optional[multiprocessing.Process] = None
+
+    def start(self) -> ShardRouter:
+        """Cria os processos e devolve o roteador que substitui o pool de testes"""
+        ctx = self._context
+        self.results = ctx.Queue()
+        self.writer = ctx.Process(target=_writer_main, name='iptv-escritor',
+                                  args=(self.bot, self.shards, self.results))
+        self.writer.start()
+        for index in range(self.shards):
+            jobs = ctx.Queue(maxsize=self.queue_size)
+            process = ctx.Process(target=_worker_main, name=f'iptv-teste-{index}',
+                                  args=(self.bot, index, jobs, self.results, self._stopping))
+            process.start()
+            self.queues.append(jobs)
+            self.workers.append(process)
+        logger.info(f"{self.shards} processo(s) de teste e 1 processo escritor iniciados")
+        return ShardRouter(self.queues, self.workers)
+
+    def stop(self, timeout: float = 30.0):
+        """Encerra os processos de teste e depois o escritor, que grava o que recebeu"""
+        self._stopping.set()
+        for jobs in self.queues:
+            try:
+                jobs.put_nowait(None)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for process in self.workers:
+            process.join(max(0.1, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"{process.name} não terminou a tempo, encerrando")
+                process.terminate()
+                process.join()
+
+        if self.writer is not None:
+            self.results.put(None)
+            self.writer.join(max(0.1, deadline - time.monotonic()))
+            if self.writer.is_alive():
+                logger.warning(f"{self.writer.name} não terminou a tempo, encerrando")
+                self.writer.terminate()
+                self.writer.join()
+        logger.info("Processos de teste e escritor encerrados")
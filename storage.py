@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Armazenamento das listas IPTV válidas
+SQLite (WAL, transações em lote, upsert por conta) ou o CSV append-only original
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Arquivo CSV para salvar listas válidas
+CSV_FILE = 'listas_iptv_validas.csv'
+
+# Banco SQLite para salvar listas válidas
+DB_FILE = 'listas_iptv_validas.db'
+
+# Cabeçalhos do CSV
+CSV_HEADERS = ['link_m3u', 'servidor', 'porta', 'username', 'password', 'data_criacao', 'data_vencimento',
+               'total_canais', 'canais_ao_vivo', 'filmes', 'series', 'taxa_funcionamento', 'grupos',
+               'hash_playlist', 'status', 'trial', 'data_teste', 'observacoes', 'canal_origem', 'mensagem_id']
+
+
+def analysis_columns(counts: Optional[Dict] = None, analise: Optional[Dict] = None) -> Dict[str, str]:
+    """
+    Colunas da análise da lista: canais por tipo, taxa de streams funcionando e maiores grupos
+
+    counts vem da API Xtream (live/vod/series); analise vem da leitura da playlist M3U
+    """
+    analise = analise or {}
+    tipos = analise.get('tipos') or counts or {}
+    amostra = analise.get('amostra') or {}
+    grupos = analise.get('grupos') or {}
+    return {
+        'canais_ao_vivo': str(tipos.get('live', '')),
+        'filmes': str(tipos.get('vod', '')),
+        'series': str(tipos.get('series', '')),
+        'taxa_funcionamento': '' if amostra.get('taxa') is None else f"{amostra['taxa']:.2f}",
+        'grupos': json.dumps({nome: sum(c.values()) for nome, c in grupos.items()},
+                             ensure_ascii=False) if grupos else ''
+    }
+
+
+def build_row(m3u_url: str, server: str, port: int, username: str, password: str,
+              created_date: str, exp_date: str, total_channels, status: str,
+              canal_origem: str, mensagem_id, observacoes: str = '',
+              analise: Optional[Dict[str, str]] = None, trial: Optional[bool] = None,
+              hash_playlist: str = '') -> Dict:
+    """
+    Monta uma linha com as colunas de CSV_HEADERS
+
+    analise: colunas de analysis_columns; trial: None quando a API não informou;
+    hash_playlist: impressão do conteúdo da playlist (vazia quando ela não foi baixada)
+    """
+    row = {
+        'link_m3u': m3u_url,
+        'servidor': server,
+        'porta': str(port),
+        'username': username,
+        'password': password,
+        'data_criacao': created_date,
+        'data_vencimento': exp_date,
+        'total_canais': str(total_channels),
+        'hash_playlist': hash_playlist or '',
+        'status': status,
+        'trial': '' if trial is None else str(bool(trial)).lower(),
+        'data_teste': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'canal_origem': canal_origem,
+        'mensagem_id': str(mensagem_id),
+        'observacoes': observacoes
+    }
+    row.update(analise or analysis_columns())
+    return row
+
+
+class CSVStore:
+    """
+    Grava cada lista como uma nova linha no CSV (comportamento original)
+
+    Com batch_size > 1 as linhas ficam em memória e são gravadas juntas a cada
+    batch_size linhas (ou em flush/close), como na importação em massa.
+
+    update_many reescreve o arquivo e pode rodar em outra thread (executor):
+    enquanto isso as linhas novas ficam pendentes em vez de bloquear quem salva.
+    """
+
+    nome = 'CSV'
+
+    def __init__(self, path: str = CSV_FILE, headers: List[str] = CSV_HEADERS, batch_size: int = 1):
+        self.path = path
+        self.headers = headers
+        self.batch_size = max(1, batch_size)
+        self._pending: List[Dict] = []
+        self._pending_lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        if not os.path.exists(self.path):
+            with open(self.path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=self.headers)
+                writer.writeheader()
+            logger.info(f"Arquivo CSV criado: {self.path}")
+        else:
+            self._migrate()
+
+    def _migrate(self):
+        """Reescreve um CSV com cabeçalhos antigos usando as colunas atuais"""
+        with open(self.path, 'r', newline='', encoding='utf-8') as f:
+            current = next(csv.reader(f), [])
+        if current == self.headers:
+            return
+        rows = self.load_rows()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.headers, restval='', extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp_path, self.path)
+        logger.info(f"CSV {self.path} atualizado para as colunas atuais ({len(rows)} linha(s))")
+
+    def save(self, row: Dict):
+        self.save_many([row])
+
+    def save_many(self, rows: Iterable[Dict]):
+        with self._pending_lock:
+            self._pending.extend(rows)
+            ready = len(self._pending) >= self.batch_size
+        if ready:
+            self.flush(wait=False)
+
+    def _take_pending(self) -> List[Dict]:
+        with self._pending_lock:
+            rows, self._pending = self._pending, []
+        return rows
+
+    def load_rows(self) -> List[Dict]:
+        """Lê todas as linhas do CSV"""
+        with open(self.path, 'r', newline='', encoding='utf-8') as f:
+            return [dict(row) for row in csv.DictReader(f)]
+
+    def update_many(self, rows: Iterable[Dict]):
+        """
+        Reescreve o CSV com os campos atualizados (mesmo servidor + username)
+
+        Cada linha traz servidor, username e só os campos a atualizar, aplicados
+        sobre a versão atual da conta (a última no CSV append-only). As linhas
+        repetidas de uma conta atualizada viram uma só, na posição da primeira;
+        contas que não estão no arquivo são ignoradas.
+        Feito uma vez por passada de revalidação, de preferência fora do event loop.
+        """
+        updates = {(row['servidor'], row['username']): row for row in rows}
+        if not updates:
+            return
+        with self._file_lock:
+            self._append(self._take_pending())
+            current = self.load_rows()
+            latest = {}
+            for row in current:
+                key = (row.get('servidor'), row.get('username'))
+                if key in updates:
+                    latest[key] = row
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=self.headers, extrasaction='ignore')
+                writer.writeheader()
+                for row in current:
+                    key = (row.get('servidor'), row.get('username'))
+                    if key not in updates:
+                        writer.writerow(row)
+                    elif key in latest:
+                        writer.writerow({**latest.pop(key), **updates[key]})
+            os.replace(tmp_path, self.path)
+        # Linhas salvas durante a reescrita
+        self.flush()
+
+    def flush(self, wait: bool = True):
+        """
+        Grava as linhas pendentes no fim do arquivo
+
+        wait=False não espera uma reescrita em andamento: as linhas continuam
+        pendentes e são gravadas no fim dela ou no próximo flush.
+        """
+        if not self._file_lock.acquire(blocking=wait):
+            return
+        try:
+            self._append(self._take_pending())
+        finally:
+            self._file_lock.release()
+
+    def _append(self, rows: List[Dict]):
+        if not rows:
+            return
+        with open(self.path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.headers)
+            writer.writerows(rows)
+
+    def close(self):
+        self.flush()
+
+
+_STOP = object()
+_FLUSH = object()
+
+
+class SQLiteStore:
+    """
+    Banco SQLite em modo WAL com uma thread de escrita
+
+    As linhas são enfileiradas e gravadas em transações de até batch_size
+    linhas (ou a cada linger segundos; flush grava na hora). Uma conta já salva
+    (servidor + username) é atualizada em vez de duplicada.
+    """
+
+    nome = 'SQLite'
+
+    def __init__(self, path: str = DB_FILE, headers: List[str] = CSV_HEADERS,
+                 batch_size: int = 50, linger: float = 1.0, import_csv: str = ''):
+        self.path = path
+        self.headers = headers
+        self.batch_size = max(1, batch_size)
+        self.linger = linger
+
+        conn = self._connect()
+        try:
+            self._create_schema(conn)
+            if import_csv and os.path.exists(import_csv) and self._is_empty(conn):
+                total = self._import_rows(conn, import_csv)
+                logger.info(f"{total} linha(s) importada(s) de {import_csv} para {self.path}")
+        finally:
+            conn.close()
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, name='sqlite-writer', daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        columns = ', '.join(f'{h} TEXT' for h in self.headers)
+        with conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS listas (id INTEGER PRIMARY KEY, {columns})')
+            # Bancos criados com versões anteriores: adiciona as colunas novas
+            existing = {row[1] for row in conn.execute('PRAGMA table_info(listas)')}
+            for header in self.headers:
+                if header not in existing:
+                    conn.execute(f'ALTER TABLE listas ADD COLUMN {header} TEXT')
+                    logger.info(f"Coluna {header} adicionada ao banco {self.path}")
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_listas_link ON listas (link_m3u)')
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_listas_conta ON listas (servidor, username)')
+
+    def _is_empty(self, conn: sqlite3.Connection) -> bool:
+        return conn.execute('SELECT 1 FROM listas LIMIT 1').fetchone() is None
+
+    def _upsert_sql(self) -> str:
+        columns = ', '.join(self.headers)
+        placeholders = ', '.join(f':{h}' for h in self.headers)
+        updates = ', '.join(f'{h} = excluded.{h}' for h in self.headers if h not in ('servidor', 'username'))
+        return (f'INSERT INTO listas ({columns}) VALUES ({placeholders}) '
+                f'ON CONFLICT (servidor, username) DO UPDATE SET {updates}')
+
+    def _write(self, conn: sqlite3.Connection, rows: List[Dict]):
+        params = [{h: row.get(h, '') for h in self.headers} for row in rows]
+        with conn:
+            conn.executemany(self._upsert_sql(), params)
+
+    def _import_rows(self, conn: sqlite3.Connection, csv_path: str) -> int:
+        total = 0
+        batch = []
+        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                batch.append(row)
+                if len(batch) >= 1000:
+                    self._write(conn, batch)
+                    total += len(batch)
+                    batch = []
+        if batch:
+            self._write(conn, batch)
+            total += len(batch)
+        return total
+
+    def import_csv(self, csv_path: str) -> int:
+        """Importa (upsert) as linhas de um CSV; retorna o número de linhas lidas"""
+        conn = self._connect()
+        try:
+            return self._import_rows(conn, csv_path)
+        finally:
+            conn.close()
+
+    def save(self, row: Dict):
+        """Enfileira uma linha para gravação (não bloqueia)"""
+        self._queue.put(row)
+
+    def save_many(self, rows: Iterable[Dict]):
+        for row in rows:
+            self._queue.put(row)
+
+    def update_many(self, rows: Iterable[Dict]):
+        """
+        Atualiza só os campos presentes em cada linha (servidor + username)
+
+        UPDATE direto em vez do upsert da fila: as demais colunas ficam com o
+        que o pipeline salvou por último. Roda na thread de quem chama.
+        """
+        groups: Dict[tuple, List[Dict]] = {}
+        for row in rows:
+            fields = tuple(h for h in self.headers if h in row and h not in ('servidor', 'username'))
+            if fields:
+                groups.setdefault(fields, []).append(row)
+        if not groups:
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                for fields, group in groups.items():
+                    updates = ', '.join(f'{h} = :{h}' for h in fields)
+                    conn.executemany(
+                        f'UPDATE listas SET {updates} WHERE servidor = :servidor AND username = :username',
+                        group
+                    )
+        finally:
+            conn.close()
+
+    def load_rows(self) -> List[Dict]:
+        """Lê todas as listas do banco"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(self.headers)} FROM listas ORDER BY id")
+            return [dict(zip(self.headers, ('' if value is None else value for value in row))) for row in cursor]
+        finally:
+            conn.close()
+
+    def flush(self):
+        """Aguarda até que todas as linhas enfileiradas estejam gravadas"""
+        if not self._thread.is_alive():
+            return
+        # O marcador faz a thread de escrita gravar o lote sem esperar o linger
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        """Grava o que estiver pendente e encerra a thread de escrita"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _writer(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                batch = [item]
+                deadline = time.monotonic() + self.linger
+                while item is not _STOP and item is not _FLUSH and len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    batch.append(item)
+
+                rows = [row for row in batch if row is not _STOP and row is not _FLUSH]
+                if rows:
+                    try:
+                        self._write(conn, rows)
+                    except sqlite3.Error as e:
+                        logger.error(f"Erro ao salvar {len(rows)} linha(s) no SQLite: {str(e)}")
+                for _ in batch:
+                    self._queue.task_done()
+                if item is _STOP:
+                    break
+        finally:
+            conn.close()
+
+    def export_csv(self, csv_path: str) -> int:
+        """Exporta a tabela para um CSV com os cabeçalhos originais"""
+        conn = self._connect()
+        try:
+            return export_csv(conn, csv_path, self.headers)
+        finally:
+            conn.close()
+
+
+def export_csv(conn: sqlite3.Connection, csv_path: str, headers: List[str] = CSV_HEADERS) -> int:
+    """Escreve todas as listas do banco em um CSV; retorna o número de linhas"""
+    total = 0
+    tmp_path = f"{csv_path}.tmp"
+    cursor = conn.execute(f"SELECT {', '.join(headers)} FROM listas ORDER BY id")
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for row in cursor:
+            writer.writerow(['' if value is None else value for value in row])
+            total += 1
+    os.replace(tmp_path, csv_path)
+    return total
+
+
+def create_store(tipo: str, csv_path: str = CSV_FILE, db_path: str = DB_FILE,
+                 batch_size: int = 50, linger: float = 1.0):
+    """Cria o armazenamento configurado (sqlite ou csv)"""
+    if tipo == 'csv':
+        return CSVStore(csv_path)
+    if tipo == 'sqlite':
+        return SQLiteStore(db_path, batch_size=batch_size, linger=linger, import_csv=csv_path)
+    raise ValueError(f"Armazenamento desconhecido: {tipo}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ferramentas do banco de listas IPTV')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    exportar = sub.add_parser('exportar-csv', help='Exporta o banco SQLite para CSV')
+    exportar.add_argument('--db', default=os.getenv('DB_ARQUIVO', DB_FILE))
+    exportar.add_argument('--saida', default=CSV_FILE)
+
+    importar = sub.add_parser('importar-csv', help='Importa (upsert) um CSV para o banco SQLite')
+    importar.add_argument('--db', default=os.getenv('DB_ARQUIVO', DB_FILE))
+    importar.add_argument('--entrada', default=CSV_FILE)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    store = SQLiteStore(args.db)
+    try:
+        if args.comando == 'exportar-csv':
+            total = store.export_csv(args.saida)
+            print(f"[OK] {total} lista(s) exportada(s) para {args.saida}")
+        else:
+            total = store.import_csv(args.entrada)
+            print(f"[OK] {total} linha(s) importada(s) de {args.entrada}")
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,54 +2,62 @@
 # -*- coding: utf-8 -*-
 """
 Bot Telegram: Monitora canais e testa listas IPTV automaticamente
-Detecta links M3U nas mensagens, testa e salva no CSV
+Detecta links M3U nas mensagens, testa e salva no CSV/SQLite
 """
 
 import os
-import re
 import asyncio
+import functools
 from telethon import TelegramClient, events
 from dotenv import load_dotenv
-import requests
+import aiohttp
 import json
+import random
+import sys
 import time
-import csv
 import logging
 from typing import Dict, Optional, List
 from datetime import datetime
 from urllib.parse import urlparse, parse_qs
 
-# Carregar variáveis do .env
-load_dotenv()
+from accounts_api import AccountsAPI, AccountsIndex
+from dns_cache import CachingResolver
+from http_client import AsyncHTTPClient
+from log_setup import configure_logging, parse_levels, redact
+from link_detector import detect_links, message_urls
+from text_matcher import TextMatcher
+from m3u_parser import CHUNK_SIZE, M3UEntryParser, M3UStreamCounter, PlaylistFingerprint, PlaylistStats
+from metrics import Metrics, MetricsExporter
+from rate_limit import RequestLimiter
+from result_cache import ResultCache, account_key, normalize_url, url_key
+from revalidation import Revalidator
+from server_health import ServerHealth
+from sharding import ShardedPipeline
+from storage import CSV_FILE, analysis_columns, build_row, create_store
+from webhook_queue import WebhookDispatcher, WebhookRejected, is_retryable
+from worker_pool import WorkerPool, server_key
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-# Arquivo CSV para salvar listas válidas
-CSV_FILE = 'listas_iptv_validas.csv'
-
-# Cabeçalhos do CSV
-CSV_HEADERS = ['link_m3u', 'servidor', 'porta', 'username', 'password', 'data_criacao', 'data_vencimento', 
-               'total_canais', 'status', 'data_teste', 'observacoes', 'canal_origem', 'mensagem_id']
+# Nome fixo: o mesmo componente (LOG_NIVEIS) executado como script ou importado
+logger = logging.getLogger('telegram_iptv_bot')
 
+# Sessão Telethon do bot (session_iptv_bot.session); outros scripts usam sessões próprias
+SESSION_FILE = 'session_iptv_bot'
 
 class WebhookSender:
     """Classe para enviar dados para webhook do n8n"""
     
-    def __init__(self, webhook_url: str, timeout: int = 30):
+    def __init__(self, webhook_url: str, timeout: int = 30, http: Optional[AsyncHTTPClient] = None):
         self.webhook_url = webhook_url
         self.timeout = timeout
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'User-Agent': 'Telegram-IPTV-Bot/1.0'
-        })
+        self.http = http or AsyncHTTPClient(
+            timeout=timeout,
+            headers={
+                'Content-Type': 'application/json',
+                'User-Agent': 'Telegram-IPTV-Bot/1.0'
+            }
+        )
     
-    def send_iptv_data(self, data: Dict) -> bool:
+    async def send_iptv_data(self, data: Dict) -> bool:
         """
         Envia dados da lista IPTV para o webhook do n8n
         
@@ -57,42 +65,39 @@ class WebhookSender:
             data: Dicionário com dados da lista IPTV
             
         Returns:
-            True se enviado com sucesso, False caso contrário
+            True se enviado com sucesso, False em falha temporária (conexão,
+            timeout, 5xx, 408, 429)
+        
+        Raises:
+            WebhookRejected: o webhook recusou os dados (demais 4xx); repetir não adianta
         """
         if not self.webhook_url:
             return False
         
         try:
-            response = self.session.post(
-                self.webhook_url,
-                json=data,
-                timeout=self.timeout
-            )
-            response.raise_for_status()
-            print(f"[OK] Dados enviados para webhook: {response.status_code}")
+            status = await self.http.post_json(self.webhook_url, data, timeout=self.timeout)
+            logger.info(f"Dados enviados para webhook: {status}", extra={'evento': 'webhook_enviado'})
             return True
-        except requests.exceptions.RequestException as e:
-            print(f"[ERRO] Falha ao enviar para webhook: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    print(f"Resposta do servidor: {e.response.text}")
-                except:
-                    pass
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"Falha ao enviar para webhook: {e.status} - resposta do servidor: {e.message}",
+                         extra={'evento': 'webhook_falhou', 'status_http': e.status})
+            if not is_retryable(e.status):
+                raise WebhookRejected(e.status, e.message)
+            return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Falha ao enviar para webhook: {e!r}", extra={'evento': 'webhook_falhou'})
             return False
         except Exception as e:
-            print(f"[ERRO] Erro inesperado ao enviar webhook: {e}")
+            logger.error(f"Erro inesperado ao enviar webhook: {e}", extra={'evento': 'webhook_falhou'})
             return False
 
 
 class XtreamCodesAPI:
     """Classe para consultar a API Xtream Codes"""
     
-    def __init__(self, timeout: int = 10):
+    def __init__(self, timeout: int = 10, http: Optional[AsyncHTTPClient] = None):
         self.timeout = timeout
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        self.http = http or AsyncHTTPClient(timeout=timeout)
     
     def extract_credentials(self, m3u_url: str) -> Optional[Dict]:
         """Extrai credenciais (servidor, porta, username, password) da URL M3U Xtream Codes"""
@@ -123,19 +128,16 @@ class XtreamCodesAPI:
             logger.error(f"Erro ao extrair credenciais: {str(e)}")
             return None
     
-    def get_account_info(self, server: str, port: int, username: str, password: str, scheme: str = 'http') -> Optional[Dict]:
+    async def get_account_info(self, server: str, port: int, username: str, password: str, scheme: str = 'http') -> Optional[Dict]:
         """Consulta informações da conta na API Xtream Codes"""
         try:
             api_url = f"{scheme}://{server}:{port}/player_api.php?username={username}&password={password}"
             
-            logger.info(f"Consultando API Xtream Codes: {api_url.replace(password, '***')}")
+            logger.info(f"Consultando API Xtream Codes: {redact(api_url)}")
             
-            response = self.session.get(api_url, timeout=self.timeout)
-            response.raise_for_status()
+            data = await self.http.get_json(api_url, timeout=self.timeout)
             
-            data = response.json()
-            
-            if 'user_info' in data:
+            if isinstance(data, dict) and 'user_info' in data:
                 user_info = data['user_info']
                 
                 created_at = user_info.get('created_at', '')
@@ -153,14 +155,15 @@ class XtreamCodesAPI:
                     'is_trial': user_info.get('is_trial', False),
                     'active_cons': user_info.get('active_cons', 0),
                     'max_connections': user_info.get('max_connections', 0),
+                    'auth': user_info.get('auth', 1),
                     'full_info': user_info
                 }
             else:
                 logger.warning("Resposta da API não contém 'user_info'")
                 return None
                 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Erro ao consultar API Xtream Codes: {str(e)}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Erro ao consultar API Xtream Codes: {e!r}")
             return None
         except json.JSONDecodeError as e:
             logger.error(f"Erro ao decodificar JSON da API: {str(e)}")
@@ -169,6 +172,80 @@ class XtreamCodesAPI:
             logger.error(f"Erro inesperado ao consultar API: {str(e)}")
             return None
     
+    def check_account(self, account_info: Dict) -> Optional[str]:
+        """
+        Verifica se a conta pode ser usada
+        
+        Returns:
+            Motivo da rejeição, ou None se a conta estiver ativa
+        """
+        if str(account_info.get('auth', 1)) == '0':
+            return "Credenciais recusadas pelo servidor"
+        
+        status = str(account_info.get('status', 'unknown'))
+        if status.lower() != 'active':
+            return f"Conta com status {status}"
+        
+        exp_date = account_info.get('exp_date')
+        try:
+            if exp_date and int(exp_date) and int(exp_date) < time.time():
+                return f"Conta vencida em {account_info.get('exp_date_formatted', 'N/A')}"
+        except (ValueError, TypeError):
+            pass
+        
+        return None
+    
+    async def get_stream_counts(self, server: str, port: int, username: str, password: str, scheme: str = 'http') -> Optional[Dict]:
+        """
+        Conta canais ao vivo, filmes e séries pelas ações da API Xtream Codes
+        
+        Returns:
+            Dicionário com 'live', 'vod', 'series' e 'total', ou None se a API não suportar
+        """
+        base_url = f"{scheme}://{server}:{port}/player_api.php?username={username}&password={password}"
+        
+        try:
+            live, vod, series = await asyncio.gather(
+                self._count_items(f"{base_url}&action=get_live_streams", b'"stream_id"'),
+                self._count_items(f"{base_url}&action=get_vod_streams", b'"stream_id"'),
+                self._count_items(f"{base_url}&action=get_series", b'"series_id"')
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Erro ao contar canais pela API Xtream Codes: {e!r}")
+            return None
+        
+        if live is None or vod is None or series is None:
+            logger.warning("API Xtream Codes não retornou as listas de canais")
+            return None
+        
+        return {
+            'live': live,
+            'vod': vod,
+            'series': series,
+            'total': live + vod + series
+        }
+    
+    async def _count_items(self, url: str, token: bytes) -> Optional[int]:
+        """Conta os itens de uma lista JSON em streaming, sem decodificá-la inteira"""
+        async with self.http.request('GET', url, timeout=self.timeout) as response:
+            response.raise_for_status()
+            
+            count = 0
+            tail = b''
+            first = True
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                if first:
+                    # A resposta precisa ser uma lista JSON
+                    if not chunk.lstrip().startswith(b'['):
+                        return None
+                    first = False
+                data = tail + chunk
+                count += data.count(token)
+                # Mantém o final do bloco para achar tokens divididos entre blocos
+                tail = data[-(len(token) - 1):]
+            
+            return None if first else count
+    
     def _timestamp_to_date(self, timestamp: str) -> str:
         """Converte timestamp Unix para data legível"""
         try:
@@ -186,140 +263,278 @@ class XtreamCodesAPI:
 
 
 class IPTVTester:
-    """Classe para testar listas IPTV"""
+    """
+    Classe para testar listas IPTV
+    
+    Com `fingerprints` (cache de resultados), guarda a contagem de cada playlist
+    pela impressão do conteúdo e os validadores HTTP (ETag/Last-Modified) de cada
+    link: uma lista já conhecida não é baixada de novo (304). Com `prefix_size`
+    (opcional, desligado por padrão) o download também é interrompido assim que
+    os primeiros bytes batem com uma lista conhecida.
+    """
     
-    def __init__(self, timeout: int = 10):
+    def __init__(self, timeout: int = 10, http: Optional[AsyncHTTPClient] = None,
+                 fingerprints: Optional[ResultCache] = None, fingerprint_ttl: int = 86400,
+                 prefix_size: int = 0):
         self.timeout = timeout
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        self.http = http or AsyncHTTPClient(timeout=timeout)
+        self.fingerprints = fingerprints
+        self.fingerprint_ttl = fingerprint_ttl
+        self.prefix_size = prefix_size
+    
+    def _known_playlist(self, digest: Optional[str], analyze: bool) -> Optional[Dict]:
+        """Contagem guardada da playlist, se ainda servir para o teste pedido"""
+        if self.fingerprints is None or not digest:
+            return None
+        known = self.fingerprints.get(f"playlist:{digest}")
+        if known is None or (analyze and 'analise' not in known):
+            return None
+        return known
+    
+    def _remember(self, m3u_url: str, results: Dict, prefix: Optional[str],
+                  etag: Optional[str], last_modified: Optional[str]):
+        """Guarda a contagem pela impressão (e pelo início) e os validadores HTTP do link"""
+        if self.fingerprints is None:
+            return
+        digest = results['hash_playlist']
+        if not results.get('reaproveitado'):
+            keys = [f"playlist:{digest}"]
+            if prefix:
+                keys.append(f"prefixo:{prefix}")
+            known = {'hash': digest, 'total_channels': results['total_channels']}
+            if 'analise' in results:
+                # A amostra de streams vale só para as credenciais testadas
+                known['analise'] = {k: v for k, v in results['analise'].items() if k != 'amostra'}
+            self.fingerprints.put(keys, known, ttl=self.fingerprint_ttl)
+        if etag or last_modified:
+            self.fingerprints.put(
+                [f"validadores:{normalize_url(m3u_url)}"],
+                {'hash': digest, 'etag': etag, 'last_modified': last_modified},
+                ttl=self.fingerprint_ttl
+            )
     
-    def test_m3u_url(self, m3u_url: str) -> Dict:
-        """Testa um link M3U"""
+    async def test_m3u_url(self, m3u_url: str, quick: bool = False, analyze: bool = False,
+                           sample_size: int = 0, probe_concurrency: int = 2,
+                           probe_bytes: int = 2048, probe_timeout: float = 5) -> Dict:
+        """
+        Testa um link M3U lendo a playlist em streaming
+        
+        Args:
+            m3u_url: URL da playlist
+            quick: Se True, valida apenas o cabeçalho e não conta os canais
+            analyze: Se True, conta as entradas por grupo e por tipo (ao vivo, filmes, séries)
+            sample_size: Streams sorteados para testar se realmente funcionam (com analyze)
+        
+        Fora do modo rápido, results['hash_playlist'] traz a impressão do conteúdo
+        (sem servidor e credenciais) e results['reaproveitado'] indica quando a
+        contagem veio de uma lista já conhecida ('etag' ou 'prefixo'). Com
+        'prefixo' a lista não foi lida inteira e hash_playlist fica de fora.
+        """
         results = {
             'url': m3u_url,
             'accessible': False,
             'valid_m3u': False,
             'total_channels': 0,
+            'channels_counted': False,
             'errors': []
         }
         
+        fingerprint = validators = known = None
+        headers = {}
+        if not quick:
+            query = parse_qs(urlparse(m3u_url).query)
+            fingerprint = PlaylistFingerprint(
+                query.get('username', [''])[0],
+                query.get('password', [''])[0],
+                prefix_size=self.prefix_size if self.fingerprints is not None else 0
+            )
+            if self.fingerprints is not None:
+                validators = self.fingerprints.get(f"validadores:{normalize_url(m3u_url)}")
+                if validators and self._known_playlist(validators['hash'], analyze):
+                    # Requisição condicional: 304 se a lista não mudou desde o último teste
+                    if validators.get('etag'):
+                        headers['If-None-Match'] = validators['etag']
+                    if validators.get('last_modified'):
+                        headers['If-Modified-Since'] = validators['last_modified']
+        
         try:
             logger.info("Verificando acessibilidade do link M3U...")
-            response = self.session.get(m3u_url, timeout=self.timeout, stream=True)
-            response.raise_for_status()
-            results['accessible'] = True
+            async with self.http.request('GET', m3u_url, timeout=self.timeout, headers=headers) as response:
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                if response.status == 304 and headers:
+                    known = self._known_playlist(validators['hash'], analyze)
+                    if known is None:
+                        results['errors'].append("Servidor respondeu 304 sem contagem guardada")
+                        return results
+                    results['accessible'] = True
+                    results['valid_m3u'] = True
+                    results['reaproveitado'] = 'etag'
+                else:
+                    response.raise_for_status()
+                    results['accessible'] = True
+                    
+                    logger.info("Verificando formato M3U...")
+                    counter = M3UStreamCounter()
+                    parser = stats = None
+                    check_prefix = self.fingerprints is not None
+                    if analyze and not quick:
+                        parser = M3UEntryParser()
+                        stats = PlaylistStats(sample_size=sample_size)
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        counter.feed(chunk)
+                        if counter.valid_header is False:
+                            break
+                        if quick and counter.valid_header:
+                            break
+                        if fingerprint is not None:
+                            fingerprint.feed(chunk)
+                            if fingerprint.prefix and check_prefix:
+                                # Início já conhecido: mesma lista, o resto não precisa ser baixado
+                                check_prefix = False
+                                seen = self.fingerprints.get(f"prefixo:{fingerprint.prefix}")
+                                known = self._known_playlist(seen and seen['hash'], analyze)
+                                if known is not None:
+                                    results['reaproveitado'] = 'prefixo'
+                                    break
+                        if stats is not None:
+                            for entry in parser.feed(chunk):
+                                stats.add(entry)
+                    if known is None:
+                        counter.close()
+                        if stats is not None and counter.valid_header:
+                            for entry in parser.close():
+                                stats.add(entry)
             
-            logger.info("Verificando formato M3U...")
-            content = response.text
-            if not content.strip().startswith('#EXTM3U'):
+            if known is not None:
+                results['valid_m3u'] = True
+                results['total_channels'] = known['total_channels']
+                results['channels_counted'] = True
+                if results['reaproveitado'] == 'etag':
+                    # 304: o servidor confirmou que é o mesmo conteúdo já hasheado
+                    results['hash_playlist'] = known['hash']
+                if 'analise' in known:
+                    results['analise'] = dict(known['analise'])
+                logger.info(f"Lista já conhecida ({results['reaproveitado']}), "
+                            f"total de canais: {known['total_channels']}")
+                if 'hash_playlist' in results:
+                    self._remember(m3u_url, results, None, etag, last_modified)
+                return results
+            
+            if not counter.valid_header:
                 results['errors'].append("Arquivo não é um M3U válido")
                 return results
             
             results['valid_m3u'] = True
             
-            logger.info("Contando canais...")
-            channels = self._count_channels(content)
+            if quick:
+                logger.info("Lista válida! (modo rápido, canais não contados)")
+                return results
+            
+            channels = counter.total_channels
             results['total_channels'] = channels
+            results['channels_counted'] = True
+            results['hash_playlist'] = fingerprint.close()
             
             logger.info(f"Lista válida! Total de canais: {channels}")
             
-        except requests.exceptions.RequestException as e:
-            results['errors'].append(f"Erro ao acessar link: {str(e)}")
-            logger.error(f"Erro ao testar lista: {str(e)}")
+            if stats is not None:
+                results['analise'] = {
+                    'tipos': dict(stats.kinds),
+                    'grupos': stats.top_groups(),
+                    'total_grupos': len(stats.groups)
+                }
+            
+            self._remember(m3u_url, results, fingerprint.prefix, etag, last_modified)
+            
+            if stats is not None and stats.sample:
+                results['analise']['amostra'] = await self.probe_streams(
+                    stats.sample, probe_concurrency, probe_bytes, probe_timeout
+                )
+            
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            results['errors'].append(f"Erro ao acessar link: {e!r}")
+            logger.error(f"Erro ao testar lista: {e!r}")
         except Exception as e:
             results['errors'].append(f"Erro inesperado: {str(e)}")
             logger.error(f"Erro inesperado: {str(e)}")
         
         return results
     
-    def _count_channels(self, content: str) -> int:
-        """Conta o número de canais no arquivo M3U"""
-        count = 0
-        lines = content.split('\n')
+    async def probe_streams(self, urls: List[str], concurrency: int = 2, read_bytes: int = 2048,
+                            timeout: float = 5) -> Dict:
+        """
+        Testa uma amostra de streams lendo só os primeiros bytes de cada um
         
-        for line in lines:
-            if line.strip().startswith('#EXTINF:'):
-                count += 1
+        Returns:
+            Dicionário com 'testados', 'funcionando' e 'taxa' (fração que respondeu com dados)
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
         
-        return count
-
-
-def init_csv_file():
-    """Inicializa o arquivo CSV com cabeçalhos se não existir"""
-    if not os.path.exists(CSV_FILE):
-        with open(CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
-            writer.writeheader()
-        logger.info(f"Arquivo CSV criado: {CSV_FILE}")
+        async def probe(url: str) -> bool:
+            async with semaphore:
+                try:
+                    headers = {'Range': f'bytes=0-{read_bytes - 1}'}
+                    async with self.http.request('GET', url, timeout=timeout, track_health=False,
+                                                 headers=headers) as response:
+                        if response.status not in (200, 206):
+                            return False
+                        return bool(await response.content.read(read_bytes))
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    return False
+        
+        working = sum(await asyncio.gather(*(probe(url) for url in urls)))
+        logger.info(f"Amostra de streams: {working}/{len(urls)} funcionando")
+        return {
+            'testados': len(urls),
+            'funcionando': working,
+            'taxa': round(working / len(urls), 2) if urls else None
+        }
 
 
 def save_to_csv(m3u_url: str, server: str, port: int, username: str, password: str,
                 created_date: str, exp_date: str, total_channels: int, 
-                status: str, canal_origem: str, mensagem_id: int, observacoes: str = ''):
-    """Salva informações da lista IPTV no arquivo CSV"""
+                status: str, canal_origem: str, mensagem_id: int, observacoes: str = '',
+                analise: Optional[Dict[str, str]] = None, trial: Optional[bool] = None,
+                hash_playlist: str = ''):
+    """Salva informações da lista IPTV no armazenamento configurado (SQLite ou CSV)"""
     try:
-        init_csv_file()
+        row = build_row(
+            m3u_url, server, port, username, password, created_date, exp_date,
+            total_channels, status, canal_origem, mensagem_id, observacoes, analise, trial,
+            hash_playlist
+        )
+        salvar_linha(row)
         
-        row = {
-            'link_m3u': m3u_url,
-            'servidor': server,
-            'porta': str(port),
-            'username': username,
-            'password': password,
-            'data_criacao': created_date,
-            'data_vencimento': exp_date,
-            'total_canais': str(total_channels),
-            'status': status,
-            'data_teste': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'canal_origem': canal_origem,
-            'mensagem_id': str(mensagem_id),
-            'observacoes': observacoes
-        }
-        
-        with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
-            writer.writerow(row)
-        
-        logger.info(f"Lista salva no CSV: {m3u_url}")
+        logger.info(f"Lista salva no {app.store.nome}: {m3u_url}")
         
     except Exception as e:
-        logger.error(f"Erro ao salvar no CSV: {str(e)}")
+        logger.error(f"Erro ao salvar no {app.store.nome}: {str(e)}")
 
 
-def detect_m3u_links(texto: str) -> List[str]:
-    """Detecta links M3U no texto"""
-    # Padrão para detectar URLs M3U Xtream Codes
-    patterns = [
-        r'https?://[^\s\)\]\"]+get\.php[^\s\)\]\"]*type=m3u[^\s\)\]\"]*',
-        r'https?://[^\s\)\]\"]+\.m3u[^\s\)\]\"]*',
-        r'https?://[^\s\)\]\"]+username=[^\s\)\]\"]*password=[^\s\)\]\"]*',
-    ]
-    
-    links = []
-    for pattern in patterns:
-        found = re.findall(pattern, texto, re.IGNORECASE)
-        links.extend(found)
-    
-    # Remover duplicatas e limpar
-    links = list(set([link.strip() for link in links if link.strip()]))
-    
-    return links
+def salvar_linha(row: Dict):
+    """Grava a linha no armazenamento e atualiza o índice de contas da API"""
+    app.store.save(row)
+    if app.accounts_index is not None:
+        app.accounts_index.add(row)
+
+
+def detect_m3u_links(texto: str, extra_urls: Optional[List[str]] = None) -> List[str]:
+    """Detecta links M3U no texto (e em URLs de entidades/botões da mensagem)"""
+    return detect_links(texto, extra_urls or ())
+
+
+@functools.lru_cache(maxsize=8)
+def _matcher_substituicoes(itens: tuple) -> TextMatcher:
+    return TextMatcher(substituicoes=dict(itens))
 
 
 def substituir_palavras_especificas(texto: str, substituicoes: dict) -> str:
-    """Substitui palavras específicas no texto"""
+    """Substitui palavras específicas no texto (matcher compilado uma vez por configuração)"""
     if not substituicoes or not texto:
         return texto
     
-    texto_modificado = texto
-    for palavra_original, palavra_nova in substituicoes.items():
-        pattern = re.compile(re.escape(palavra_original), re.IGNORECASE)
-        texto_modificado = pattern.sub(palavra_nova, texto_modificado)
-        print(f"[INFO] Substituído: '{palavra_original}' -> '{palavra_nova}'")
-    
-    return texto_modificado
+    return _matcher_substituicoes(tuple(substituicoes.items())).substitute(texto)
 
 
 class Configuracao:
@@ -362,31 +577,353 @@ class Configuracao:
         # Timeout para requisições IPTV
         self.iptv_timeout = int(os.getenv('IPTV_TIMEOUT', '15'))
         
+        # Modo rápido: valida só o cabeçalho #EXTM3U, sem contar os canais
+        self.m3u_modo_rapido = os.getenv('M3U_MODO_RAPIDO', 'false').lower() == 'true'
+        
+        # Contagem de canais: api (ações Xtream), m3u (baixa a playlist) ou nenhuma
+        self.contagem_canais = os.getenv('CONTAGEM_CANAIS', 'api').strip().lower()
+        if self.contagem_canais not in ('api', 'm3u', 'nenhuma'):
+            raise ValueError('CONTAGEM_CANAIS deve ser api, m3u ou nenhuma!')
+        
+        # Análise da playlist baixada: grupos, tipos e amostra de streams testados
+        self.analise_m3u = os.getenv('ANALISE_M3U', 'false').lower() == 'true'
+        self.amostra_streams = int(os.getenv('AMOSTRA_STREAMS', '10'))
+        self.sondagem_simultaneas = int(os.getenv('SONDAGEM_SIMULTANEAS', '2'))
+        self.sondagem_bytes = int(os.getenv('SONDAGEM_BYTES', '2048'))
+        self.sondagem_timeout = float(os.getenv('SONDAGEM_TIMEOUT', '5'))
+        
         # URL do webhook do n8n (opcional)
         self.webhook_url = os.getenv('WEBHOOK_URL', '')
         
         # Timeout para requisições webhook
         self.webhook_timeout = int(os.getenv('WEBHOOK_TIMEOUT', '30'))
+        
+        # Entrega do webhook em background: lote, retry com backoff e spool em disco
+        self.webhook_lote = int(os.getenv('WEBHOOK_LOTE', '1'))
+        self.webhook_espera_lote = float(os.getenv('WEBHOOK_ESPERA_LOTE', '2.0'))
+        self.webhook_backoff_max = float(os.getenv('WEBHOOK_BACKOFF_MAX', '300'))
+        self.webhook_spool_dir = os.getenv('WEBHOOK_SPOOL_DIR', 'webhook_spool')
+        
+        # Pool de conexões HTTP (keep-alive)
+        self.http_max_conexoes = int(os.getenv('HTTP_MAX_CONEXOES', '100'))
+        self.http_max_conexoes_por_host = int(os.getenv('HTTP_MAX_CONEXOES_POR_HOST', '4'))
+        
+        # Cache de DNS dos painéis (TTL 0 desativa) e pré-conexão ao detectar links
+        self.dns_cache_ttl = float(os.getenv('DNS_CACHE_TTL', '300'))
+        self.dns_cache_ttl_negativo = float(os.getenv('DNS_CACHE_TTL_NEGATIVO', '30'))
+        self.preconexao = os.getenv('PRECONEXAO', 'false').lower() == 'true'
+        
+        # Saúde dos servidores: circuit breaker e timeouts adaptativos por host:porta
+        self.circuito_ativo = os.getenv('CIRCUITO_ATIVO', 'true').lower() == 'true'
+        self.circuito_taxa_falhas = float(os.getenv('CIRCUITO_TAXA_FALHAS', '0.5'))
+        self.circuito_min_requisicoes = int(os.getenv('CIRCUITO_MIN_REQUISICOES', '3'))
+        self.circuito_espera = float(os.getenv('CIRCUITO_ESPERA', '30'))
+        self.circuito_espera_max = float(os.getenv('CIRCUITO_ESPERA_MAX', '600'))
+        self.timeout_adaptativo = os.getenv('TIMEOUT_ADAPTATIVO', 'true').lower() == 'true'
+        self.timeout_minimo = float(os.getenv('TIMEOUT_MINIMO', '3'))
+        
+        # Pool de testes de links
+        self.workers_teste = int(os.getenv('WORKERS_TESTE', '10'))
+        self.max_testes_simultaneos = int(os.getenv('MAX_TESTES_SIMULTANEOS', '20'))
+        self.max_testes_por_servidor = int(os.getenv('MAX_TESTES_POR_SERVIDOR', '2'))
+        self.tamanho_fila = int(os.getenv('TAMANHO_FILA', '500'))
+        
+        # Justiça entre canais: limite de links na fila por canal e pesos do round-robin
+        self.tamanho_fila_por_canal = int(os.getenv('TAMANHO_FILA_POR_CANAL', '100'))
+        self.pesos_canais = {}
+        for item in os.getenv('PESOS_CANAIS', '').split(','):
+            if ':' in item:
+                canal, peso = item.rsplit(':', 1)
+                self.pesos_canais[canal.strip()] = max(1, int(peso))
+        
+        # Limite de requisições por segundo aos servidores IPTV (0 = sem limite)
+        self.requisicoes_por_segundo = float(os.getenv('REQUISICOES_POR_SEGUNDO', '0'))
+        self.requisicoes_por_segundo_servidor = float(os.getenv('REQUISICOES_POR_SEGUNDO_SERVIDOR', '0'))
+        self.rajada_requisicoes = float(os.getenv('RAJADA_REQUISICOES', '5'))
+        
+        # Processos de teste (1 = tudo no mesmo processo; N > 1 = ingestão, N testadores e um escritor)
+        self.processos_teste = int(os.getenv('PROCESSOS_TESTE', '1'))
+        
+        # Logging: nível padrão e por componente, formato (json ou texto), amostragem e fila
+        self.log_nivel = os.getenv('LOG_NIVEL', 'INFO').strip().upper()
+        self.log_niveis = parse_levels(os.getenv('LOG_NIVEIS', ''))
+        self.log_formato = os.getenv('LOG_FORMATO', 'json').strip().lower()
+        if self.log_formato not in ('json', 'texto'):
+            raise ValueError('LOG_FORMATO deve ser json ou texto!')
+        self.log_amostragem = float(os.getenv('LOG_AMOSTRAGEM', '10'))
+        self.log_fila = int(os.getenv('LOG_FILA', '10000'))
+        
+        # Espera (segundos) antes de reiniciar após uma queda: dobra a cada falha seguida, com jitter
+        self.reinicio_espera = float(os.getenv('REINICIO_ESPERA', '1'))
+        self.reinicio_espera_max = float(os.getenv('REINICIO_ESPERA_MAX', '60'))
+        
+        # Cache de links/contas já testados
+        self.cache_ativo = os.getenv('CACHE_ATIVO', 'true').lower() == 'true'
+        self.cache_arquivo = os.getenv('CACHE_ARQUIVO', 'cache_links.json')
+        self.cache_ttl = int(os.getenv('CACHE_TTL', '21600'))
+        self.cache_ttl_invalido = int(os.getenv('CACHE_TTL_INVALIDO', '3600'))
+        self.cache_max_itens = int(os.getenv('CACHE_MAX_ITENS', '10000'))
+        
+        # Impressão das playlists (no cache): por quanto tempo a contagem de uma lista
+        # conhecida é reaproveitada e quanto do início basta para reconhecê-la (0 = lista inteira)
+        self.hash_playlist_ttl = int(os.getenv('HASH_PLAYLIST_TTL', '86400'))
+        self.hash_playlist_prefixo_kb = int(os.getenv('HASH_PLAYLIST_PREFIXO_KB', '0'))
+        
+        # Armazenamento: sqlite (padrão) ou csv (append-only original)
+        self.armazenamento = os.getenv('ARMAZENAMENTO', 'sqlite').strip().lower()
+        if self.armazenamento not in ('sqlite', 'csv'):
+            raise ValueError('ARMAZENAMENTO deve ser sqlite ou csv!')
+        self.db_arquivo = os.getenv('DB_ARQUIVO', 'listas_iptv_validas.db')
+        self.db_lote = int(os.getenv('DB_LOTE', '50'))
+        self.db_intervalo_commit = float(os.getenv('DB_INTERVALO_COMMIT', '1.0'))
+        
+        # Métricas: endpoint Prometheus local (porta 0 desativa) e snapshots JSON opcionais
+        self.metricas_host = os.getenv('METRICAS_HOST', '127.0.0.1')
+        self.metricas_porta = int(os.getenv('METRICAS_PORTA', '9108'))
+        self.metricas_snapshot = os.getenv('METRICAS_SNAPSHOT', '')
+        self.metricas_intervalo_snapshot = float(os.getenv('METRICAS_INTERVALO_SNAPSHOT', '60'))
+        
+        # API de consulta das contas salvas (índice em memória; porta 0 desativa)
+        self.contas_api_host = os.getenv('CONTAS_API_HOST', '127.0.0.1')
+        self.contas_api_porta = int(os.getenv('CONTAS_API_PORTA', '0'))
+        
+        # Revalidação periódica das contas salvas (status e data_teste)
+        self.revalidacao_ativa = os.getenv('REVALIDACAO_ATIVA', 'false').lower() == 'true'
+        self.revalidacao_intervalo = float(os.getenv('REVALIDACAO_INTERVALO', '3600'))
+        self.revalidacao_idade_min = float(os.getenv('REVALIDACAO_IDADE_MIN', '21600'))
+        self.revalidacao_lote = int(os.getenv('REVALIDACAO_LOTE', '100'))
+        self.revalidacao_por_segundo = float(os.getenv('REVALIDACAO_POR_SEGUNDO', '5'))
+        self.revalidacao_simultaneas = int(os.getenv('REVALIDACAO_SIMULTANEAS', '10'))
+
+
+class BotApp:
+    """
+    Componentes do bot, criados sob demanda
+    
+    Importar o módulo não lê o .env, não abre sessões HTTP, banco ou CSV e não cria
+    o cliente do Telegram: cada componente é montado no primeiro acesso (app.store,
+    app.client, ...) e reaproveitado depois, inclusive quando o bot reinicia após
+    uma queda. Um componente pode ser substituído por atribuição antes do primeiro
+    uso (ex.: app.store nos processos de teste).
+    """
+    
+    def __init__(self, config: Optional[Configuracao] = None):
+        if config is not None:
+            self.config = config
+    
+    def is_built(self, name: str) -> bool:
+        """Indica se o componente já foi criado (sem criá-lo)"""
+        return name in self.__dict__
+    
+    @functools.cached_property
+    def config(self) -> Configuracao:
+        load_dotenv()
+        return Configuracao()
+    
+    @functools.cached_property
+    def metrics(self) -> Metrics:
+        return Metrics()
+    
+    @functools.cached_property
+    def metrics_exporter(self) -> MetricsExporter:
+        return MetricsExporter(
+            self.metrics,
+            host=self.config.metricas_host,
+            port=self.config.metricas_porta,
+            snapshot_path=self.config.metricas_snapshot,
+            snapshot_interval=self.config.metricas_intervalo_snapshot
+        )
+    
+    @functools.cached_property
+    def server_health(self) -> Optional[ServerHealth]:
+        """Estado dos servidores compartilhado pela API e pelo testador de playlists"""
+        config = self.config
+        if not config.circuito_ativo and not config.timeout_adaptativo:
+            return None
+        health = ServerHealth(
+            failure_rate=config.circuito_taxa_falhas,
+            min_requests=config.circuito_min_requisicoes,
+            cooldown=config.circuito_espera,
+            max_cooldown=config.circuito_espera_max,
+            adaptive=config.timeout_adaptativo,
+            min_timeout=config.timeout_minimo
+        )
+        if not config.circuito_ativo:
+            # Só timeouts adaptativos: o circuito nunca abre
+            health.failure_rate = float('inf')
+        self.metrics.gauge('circuitos_abertos', health.open_count, 'Servidores com o circuito aberto')
+        return health
+    
+    @functools.cached_property
+    def iptv_http(self) -> AsyncHTTPClient:
+        """Um único pool de conexões para a API e a playlist: mesma conexão keep-alive e mesmo DNS"""
+        config = self.config
+        resolver = CachingResolver(
+            ttl=config.dns_cache_ttl,
+            negative_ttl=config.dns_cache_ttl_negativo
+        ) if config.dns_cache_ttl > 0 else None
+        if resolver is not None:
+            self.metrics.gauge('dns_cache_hosts', lambda: len(resolver), 'Hosts no cache de DNS')
+        limiter = RequestLimiter(
+            rate=config.requisicoes_por_segundo,
+            per_server_rate=config.requisicoes_por_segundo_servidor,
+            burst=config.rajada_requisicoes
+        )
+        if limiter.enabled:
+            self.metrics.gauge('requisicoes_atrasadas', lambda: limiter.delayed,
+                               'Requisições que aguardaram o limite por segundo')
+        return AsyncHTTPClient(
+            timeout=config.iptv_timeout,
+            limit=config.http_max_conexoes,
+            limit_per_host=config.http_max_conexoes_por_host,
+            health=self.server_health,
+            resolver=resolver,
+            limiter=limiter if limiter.enabled else None
+        )
+    
+    @functools.cached_property
+    def xtream_api(self) -> XtreamCodesAPI:
+        return XtreamCodesAPI(timeout=self.config.iptv_timeout, http=self.iptv_http)
+    
+    @functools.cached_property
+    def iptv_tester(self) -> IPTVTester:
+        return IPTVTester(
+            timeout=self.config.iptv_timeout,
+            http=self.iptv_http,
+            fingerprints=self.result_cache,
+            fingerprint_ttl=self.config.hash_playlist_ttl,
+            prefix_size=self.config.hash_playlist_prefixo_kb * 1024
+        )
+    
+    @functools.cached_property
+    def webhook_sender(self) -> Optional[WebhookSender]:
+        if not self.config.webhook_url:
+            return None
+        return WebhookSender(self.config.webhook_url, timeout=self.config.webhook_timeout)
+    
+    @functools.cached_property
+    def webhook_dispatcher(self) -> Optional[WebhookDispatcher]:
+        if not self.webhook_sender:
+            return None
+        dispatcher = WebhookDispatcher(
+            lambda payload: enviar_webhook(payload),
+            spool_dir=self.config.webhook_spool_dir,
+            batch_size=self.config.webhook_lote,
+            linger=self.config.webhook_espera_lote,
+            backoff_max=self.config.webhook_backoff_max
+        )
+        self.metrics.gauge('webhook_pendentes', dispatcher.pending, 'Eventos aguardando entrega ao webhook')
+        return dispatcher
+    
+    @functools.cached_property
+    def result_cache(self) -> Optional[ResultCache]:
+        if not self.config.cache_ativo:
+            return None
+        cache = ResultCache(
+            self.config.cache_arquivo,
+            ttl=self.config.cache_ttl,
+            max_items=self.config.cache_max_itens
+        )
+        self.metrics.gauge('cache_itens', lambda: len(cache), 'Links e contas no cache de resultados')
+        return cache
+    
+    @functools.cached_property
+    def link_pool(self) -> WorkerPool:
+        pool = WorkerPool(
+            lambda job: processar_link(job),
+            workers=self.config.workers_teste,
+            max_concurrency=self.config.max_testes_simultaneos,
+            max_per_server=self.config.max_testes_por_servidor,
+            queue_size=self.config.tamanho_fila,
+            max_per_group=self.config.tamanho_fila_por_canal,
+            weights=self.config.pesos_canais
+        )
+        self.metrics.gauge('fila_testes', pool.qsize, 'Links aguardando teste na fila')
+        self.metrics.gauge('testes_em_andamento', lambda: pool.active, 'Links sendo testados no momento')
+        return pool
+    
+    @functools.cached_property
+    def text_matcher(self) -> TextMatcher:
+        return TextMatcher.from_config(self.config)
+    
+    @functools.cached_property
+    def client(self) -> TelegramClient:
+        client = TelegramClient(SESSION_FILE, self.config.api_id, self.config.api_hash)
+        client.add_event_handler(handler, events.NewMessage(chats=self.config.canais_origem))
+        return client
+    
+    @functools.cached_property
+    def store(self):
+        """Armazenamento configurado (cria o CSV ou o banco SQLite se não existirem)"""
+        return create_store(
+            self.config.armazenamento,
+            csv_path=CSV_FILE,
+            db_path=self.config.db_arquivo,
+            batch_size=self.config.db_lote,
+            linger=self.config.db_intervalo_commit
+        )
+    
+    @functools.cached_property
+    def revalidator(self) -> Optional[Revalidator]:
+        if not self.config.revalidacao_ativa:
+            return None
+        return Revalidator(
+            self.xtream_api,
+            self.store,
+            batch_size=self.config.revalidacao_lote,
+            rate=self.config.revalidacao_por_segundo,
+            max_servers=self.config.revalidacao_simultaneas,
+            min_age=self.config.revalidacao_idade_min,
+            metrics=self.metrics,
+            index=self.accounts_index
+        )
+    
+    @functools.cached_property
+    def accounts_index(self) -> Optional[AccountsIndex]:
+        """Contas salvas em memória, só quando a API de contas está ativa"""
+        if not self.config.contas_api_porta:
+            return None
+        index = AccountsIndex()
+        self.metrics.gauge('contas_indexadas', lambda: len(index), 'Contas no índice da API de contas')
+        return index
+    
+    @functools.cached_property
+    def accounts_api(self) -> Optional[AccountsAPI]:
+        if self.accounts_index is None:
+            return None
+        return AccountsAPI(
+            self.accounts_index,
+            store=self.store,
+            host=self.config.contas_api_host,
+            port=self.config.contas_api_porta
+        )
 
 
-# Inicializar configuração
-try:
-    config = Configuracao()
-except ValueError as e:
-    print(f"[ERRO] Erro de configuração: {e}")
-    exit(1)
+app = BotApp()
 
-# Inicializar componentes
-xtream_api = XtreamCodesAPI(timeout=config.iptv_timeout)
-iptv_tester = IPTVTester(timeout=config.iptv_timeout)
-webhook_sender = WebhookSender(config.webhook_url, timeout=config.webhook_timeout) if config.webhook_url else None
-client = TelegramClient('session_iptv_bot', config.api_id, config.api_hash)
 
-# Inicializar CSV
-init_csv_file()
+def carregar_configuracao() -> Configuracao:
+    """
+    Carrega a configuração do .env e configura o logging (em fila, ver log_setup)
+    
+    Usado pelos pontos de entrada (bot e scripts): encerra com a mensagem de erro
+    se a configuração estiver inválida.
+    """
+    try:
+        config = app.config
+    except ValueError as e:
+        print(f"[ERRO] Erro de configuração: {e}")
+        sys.exit(1)
+    configure_logging(
+        level=config.log_nivel,
+        levels=config.log_niveis,
+        fmt=config.log_formato,
+        sample_interval=config.log_amostragem,
+        queue_size=config.log_fila
+    )
+    return config
 
 
-@client.on(events.NewMessage(chats=config.canais_origem))
 async def handler(event):
     """Handler para novas mensagens"""
     mensagem = event.message
@@ -395,162 +932,483 @@ async def handler(event):
     canal_titulo = event.chat.title if hasattr(event.chat, 'title') else 'Desconhecido'
     canal_id = event.chat.id if hasattr(event.chat, 'id') else None
     
-    print(f"\n[INFO] Nova mensagem recebida de {canal_titulo}")
-    print(f"[INFO] Texto: {texto[:100]}..." if len(texto) > 100 else f"[INFO] Texto: {texto}")
+    app.metrics.inc('mensagens_total', {'canal_origem': canal_titulo}, help='Mensagens recebidas')
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Nova mensagem recebida de {canal_titulo}: {texto[:100]}",
+                     extra={'evento': 'mensagem', 'canal_origem': canal_titulo, 'mensagem_id': mensagem.id})
+    
+    # Palavras-chave e palavras bloqueadas em uma única passada, depois as substituições
+    with app.metrics.stage('filtro'):
+        filtro = app.text_matcher.scan(texto)
     
     # Verificar palavras-chave (se configuradas)
-    if config.palavras_chave:
-        if not any(p in texto.lower() for p in config.palavras_chave):
-            print(f"[IGNORADO] Mensagem não contém palavras-chave")
-            return
+    if app.config.palavras_chave and not filtro.has_keyword:
+        logger.info(f"Mensagem de {canal_titulo} ignorada: não contém palavras-chave",
+                    extra={'evento': 'mensagem_ignorada', 'canal_origem': canal_titulo,
+                           'amostragem': 'mensagem_ignorada'})
+        return
     
     # Verificar palavras bloqueadas
-    if config.palavras_bloqueadas:
-        if any(p in texto.lower() for p in config.palavras_bloqueadas):
-            print(f"[BLOQUEADO] Mensagem bloqueada por conter palavra proibida")
-            return
+    if filtro.blocked:
+        logger.info(f"Mensagem de {canal_titulo} bloqueada por conter palavra proibida",
+                    extra={'evento': 'mensagem_bloqueada', 'canal_origem': canal_titulo,
+                           'amostragem': 'mensagem_bloqueada'})
+        return
     
-    # Substituir palavras específicas
-    texto_modificado = substituir_palavras_especificas(texto, config.substituicoes)
+    # Texto com as substituições aplicadas
+    texto_modificado = filtro.texto
     
-    # Detectar links M3U
-    m3u_links = detect_m3u_links(texto)
+    # Detectar links M3U (texto, links de texto e botões)
+    with app.metrics.stage('deteccao'):
+        m3u_links = detect_m3u_links(texto, message_urls(mensagem))
     
     # Processar links M3U se encontrados e se teste automático estiver ativado
-    if m3u_links and config.testar_automatico:
-        print(f"[INFO] {len(m3u_links)} link(s) M3U detectado(s)")
+    if m3u_links and app.config.testar_automatico:
+        logger.info(f"{len(m3u_links)} link(s) M3U detectado(s) na mensagem de {canal_titulo}",
+                    extra={'evento': 'links_detectados', 'canal_origem': canal_titulo, 'links': len(m3u_links)})
+        app.metrics.inc('links_detectados_total', {'canal_origem': canal_titulo}, len(m3u_links),
+                    help='Links M3U detectados nas mensagens')
+        aquecer_servidores(m3u_links)
         
+        # Apenas enfileira: os testes rodam no pool de workers
         for m3u_url in m3u_links:
-            print(f"\n[INFO] Processando link M3U: {m3u_url[:80]}...")
-            
-            # Testar lista IPTV
-            test_results = iptv_tester.test_m3u_url(m3u_url)
-            
-            if not test_results['accessible'] or not test_results['valid_m3u']:
-                print(f"[ERRO] Lista IPTV inválida ou inacessível")
-                print(f"Erros: {test_results['errors']}")
-                continue
-            
-            # Extrair credenciais Xtream Codes
-            credentials = xtream_api.extract_credentials(m3u_url)
-            
-            if not credentials:
-                print(f"[ERRO] Não foi possível extrair credenciais Xtream Codes")
-                continue
-            
-            # Consultar API Xtream Codes
-            account_info = xtream_api.get_account_info(
-                server=credentials['server'],
-                port=credentials['port'],
-                username=credentials['username'],
-                password=credentials['password'],
-                scheme=credentials['scheme']
-            )
-            
-            if not account_info:
-                print(f"[ERRO] Não foi possível consultar API Xtream Codes")
-                continue
-            
-            # Salvar no CSV
-            observacoes = f"Status: {account_info.get('status', 'unknown')}, "
-            observacoes += f"Trial: {account_info.get('is_trial', False)}, "
-            observacoes += f"Conexões: {account_info.get('active_cons', 0)}/{account_info.get('max_connections', 0)}"
-            
-            save_to_csv(
-                m3u_url=m3u_url,
-                server=credentials['server'],
-                port=credentials['port'],
-                username=credentials['username'],
-                password=credentials['password'],
-                created_date=account_info['created_date'],
-                exp_date=account_info['exp_date_formatted'],
-                total_channels=test_results['total_channels'],
-                status=account_info.get('status', 'unknown'),
-                canal_origem=canal_titulo,
-                mensagem_id=mensagem.id,
-                observacoes=observacoes
+            await app.link_pool.submit({
+                'm3u_url': m3u_url,
+                'canal_titulo': canal_titulo,
+                'canal_id': canal_id,
+                'mensagem_id': mensagem.id,
+                'mensagem_data': mensagem.date.isoformat() if mensagem.date else None
+            })
+
+
+# Tarefas de aquecimento em andamento (referência para não serem coletadas)
+_aquecimentos = set()
+
+
+def aquecer_servidores(m3u_links: List[str]):
+    """
+    Resolve o DNS dos servidores dos links detectados enquanto eles aguardam na fila
+    
+    Com PRECONEXAO=true também abre a conexão keep-alive, mas só quando a fila está
+    curta o bastante para o teste começar antes de a conexão expirar.
+    """
+    if not isinstance(app.link_pool, WorkerPool):
+        # Com PROCESSOS_TESTE > 1 os testes (e as conexões) ficam nos processos de teste
+        return
+    connect = app.config.preconexao and app.link_pool.qsize() < app.config.workers_teste
+    if app.iptv_http.resolver is None and not connect:
+        return
+    servidores = set()
+    for m3u_url in m3u_links:
+        key = server_key(m3u_url)
+        if key in servidores:
+            continue
+        servidores.add(key)
+        task = asyncio.get_running_loop().create_task(app.iptv_http.warmup(m3u_url, connect=connect))
+        _aquecimentos.add(task)
+        task.add_done_callback(_aquecimentos.discard)
+
+
+# Conta usada quando a API Xtream Codes não responde e a lista é validada pela playlist
+CONTA_DESCONHECIDA = {
+    'created_date': 'N/A',
+    'exp_date_formatted': 'N/A',
+    'status': 'unknown',
+    'is_trial': False,
+    'active_cons': 0,
+    'max_connections': 0,
+    'api_disponivel': False
+}
+
+
+async def testar_playlist(m3u_url: str) -> Dict:
+    """Baixa e testa a playlist M3U com as opções de análise configuradas"""
+    return await app.iptv_tester.test_m3u_url(
+        m3u_url,
+        quick=app.config.m3u_modo_rapido,
+        analyze=app.config.analise_m3u,
+        sample_size=app.config.amostra_streams,
+        probe_concurrency=app.config.sondagem_simultaneas,
+        probe_bytes=app.config.sondagem_bytes,
+        probe_timeout=app.config.sondagem_timeout
+    )
+
+
+async def validar_link(m3u_url: str) -> Optional[Dict]:
+    """
+    Valida um link IPTV priorizando a API Xtream Codes
+    
+    Consulta player_api.php antes de baixar a playlist: contas inativas ou
+    vencidas são rejeitadas sem nenhum download. A playlist M3U só é baixada
+    quando a API não responde ou quando CONTAGEM_CANAIS=m3u.
+    
+    Returns:
+        Dicionário com credentials, account_info e test_results, ou None se o link for rejeitado
+    """
+    # Extrair credenciais Xtream Codes
+    credentials = app.xtream_api.extract_credentials(m3u_url)
+    
+    if not credentials:
+        logger.warning(f"Não foi possível extrair credenciais Xtream Codes: {m3u_url[:80]}",
+                       extra={'evento': 'link_rejeitado', 'motivo': 'sem_credenciais'})
+        return None
+    
+    # Consultar API Xtream Codes
+    with app.metrics.stage('api'):
+        account_info = await app.xtream_api.get_account_info(
+            server=credentials['server'],
+            port=credentials['port'],
+            username=credentials['username'],
+            password=credentials['password'],
+            scheme=credentials['scheme']
+        )
+    
+    if account_info:
+        motivo = app.xtream_api.check_account(account_info)
+        if motivo:
+            logger.info(f"Lista IPTV rejeitada pela API: {motivo}",
+                        extra={'evento': 'link_rejeitado', 'motivo': motivo, 'servidor': credentials['server']})
+            return None
+        
+        test_results = {
+            'url': m3u_url,
+            'origem': 'api',
+            'accessible': True,
+            'valid_m3u': None,
+            'total_channels': 0,
+            'channels_counted': False,
+            'errors': []
+        }
+        
+        if app.config.contagem_canais == 'api':
+            with app.metrics.stage('contagem_api'):
+                counts = await app.xtream_api.get_stream_counts(
+                    server=credentials['server'],
+                    port=credentials['port'],
+                    username=credentials['username'],
+                    password=credentials['password'],
+                    scheme=credentials['scheme']
+                )
+            if counts:
+                test_results['total_channels'] = counts['total']
+                test_results['channels_counted'] = True
+                test_results['stream_counts'] = counts
+        elif app.config.contagem_canais == 'm3u':
+            with app.metrics.stage('teste_m3u'):
+                test_results = await testar_playlist(m3u_url)
+            test_results['origem'] = 'm3u'
+    else:
+        logger.warning("API Xtream Codes indisponível, validando pela playlist M3U",
+                       extra={'evento': 'api_indisponivel', 'servidor': credentials['server']})
+        with app.metrics.stage('teste_m3u'):
+            test_results = await testar_playlist(m3u_url)
+        test_results['origem'] = 'm3u'
+        account_info = dict(CONTA_DESCONHECIDA)
+    
+    if not test_results['accessible'] or test_results['valid_m3u'] is False:
+        logger.info(f"Lista IPTV inválida ou inacessível: {test_results['errors']}",
+                    extra={'evento': 'link_rejeitado', 'motivo': 'playlist_invalida', 'servidor': credentials['server']})
+        return None
+    
+    return {
+        'credentials': credentials,
+        'account_info': account_info,
+        'test_results': test_results
+    }
+
+
+async def processar_link(job: Dict):
+    """Processa um link do pool registrando a duração e o resultado nas métricas"""
+    labels = {'canal_origem': job['canal_titulo'], 'servidor': server_key(job['m3u_url'])}
+    with app.metrics.stage('link'):
+        try:
+            resultado = await testar_link(job)
+        except Exception:
+            app.metrics.inc('listas_total', dict(labels, resultado='erro'))
+            raise
+    app.metrics.inc('listas_total', dict(labels, resultado=resultado),
+                help='Links testados por resultado (valido, invalido, cache, erro)')
+
+
+async def testar_link(job: Dict) -> str:
+    """
+    Testa um link M3U enfileirado, salva no armazenamento e envia para o webhook
+    
+    Returns:
+        Resultado do teste: valido, invalido ou cache
+    """
+    m3u_url = job['m3u_url']
+    canal_titulo = job['canal_titulo']
+    canal_id = job['canal_id']
+    mensagem_id = job['mensagem_id']
+    mensagem_data = job['mensagem_data']
+    
+    logger.info(f"Processando link M3U: {m3u_url[:80]}",
+                extra={'evento': 'link_processando', 'canal_origem': canal_titulo})
+    
+    # Links e contas testados recentemente são respondidos pelo cache, sem rede
+    cache_keys = [url_key(m3u_url)]
+    credentials = app.xtream_api.extract_credentials(m3u_url)
+    if credentials:
+        cache_keys.append(account_key(credentials['server'], credentials['port'], credentials['username']))
+    
+    if app.result_cache is not None:
+        cached = app.result_cache.get_any(cache_keys)
+        if cached is not None:
+            logger.info(f"Link já testado em {cached['data_teste']} "
+                        f"({'válido' if cached['valido'] else 'inválido'}), ignorando",
+                        extra={'evento': 'link_cache', 'canal_origem': canal_titulo, 'amostragem': 'link_cache'})
+            return 'cache'
+    
+    resultado = await validar_link(m3u_url)
+    if not resultado:
+        if app.result_cache is not None:
+            app.result_cache.put(
+                cache_keys,
+                {'valido': False, 'data_teste': datetime.now().strftime('%Y-%m-%d %H:%M:%S')},
+                ttl=app.config.cache_ttl_invalido
             )
-            
-            print(f"[OK] Lista IPTV válida e salva no CSV!")
-            print(f"  • Canais: {test_results['total_channels']}")
-            print(f"  • Status: {account_info.get('status', 'unknown')}")
-            print(f"  • Vencimento: {account_info['exp_date_formatted']}")
-            
-            # Enviar para webhook do n8n se configurado
-            if webhook_sender:
-                dados_webhook = {
-                    'timestamp': datetime.now().isoformat(),
-                    'tipo': 'lista_iptv_valida',
-                    'link_m3u': m3u_url,
-                    'servidor': credentials['server'],
-                    'porta': credentials['port'],
-                    'username': credentials['username'],
-                    'password': credentials['password'],
-                    'data_criacao': account_info['created_date'],
-                    'data_vencimento': account_info['exp_date_formatted'],
-                    'total_canais': test_results['total_channels'],
-                    'status': account_info.get('status', 'unknown'),
-                    'is_trial': account_info.get('is_trial', False),
-                    'active_cons': account_info.get('active_cons', 0),
-                    'max_connections': account_info.get('max_connections', 0),
-                    'canal_origem': {
-                        'titulo': canal_titulo,
-                        'id': canal_id
-                    },
-                    'mensagem': {
-                        'id': mensagem.id,
-                        'data': mensagem.date.isoformat() if mensagem.date else None
-                    },
-                    'teste': {
-                        'accessible': test_results['accessible'],
-                        'valid_m3u': test_results['valid_m3u'],
-                        'total_channels': test_results['total_channels']
-                    }
-                }
-                
-                print(f"[INFO] Enviando dados para webhook do n8n...")
-                sucesso = webhook_sender.send_iptv_data(dados_webhook)
-                
-                if sucesso:
-                    print(f"[OK] Dados enviados com sucesso para o webhook")
-                else:
-                    print(f"[AVISO] Falha ao enviar para webhook (lista salva no CSV)")
+        return 'invalido'
+    
+    credentials = resultado['credentials']
+    account_info = resultado['account_info']
+    test_results = resultado['test_results']
+    total_canais = test_results['total_channels'] if test_results.get('channels_counted') else 'N/A'
+    
+    if app.result_cache is not None:
+        app.result_cache.put(cache_keys, {
+            'valido': True,
+            'data_teste': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'status': account_info.get('status', 'unknown'),
+            'total_canais': total_canais
+        })
+    
+    # Salvar no CSV/SQLite
+    observacoes = f"Status: {account_info.get('status', 'unknown')}, "
+    observacoes += f"Trial: {account_info.get('is_trial', False)}, "
+    observacoes += f"Conexões: {account_info.get('active_cons', 0)}/{account_info.get('max_connections', 0)}"
+    if not account_info.get('api_disponivel', True):
+        observacoes += ", API Xtream indisponível"
+    
+    # Conta de teste segundo a API (desconhecido quando a API não respondeu)
+    trial = None
+    if account_info.get('api_disponivel', True):
+        trial = str(account_info.get('is_trial', '')).lower() in ('1', 'true')
+    
+    # Canais por tipo, streams funcionando e maiores grupos (API ou análise da playlist)
+    analise = analysis_columns(test_results.get('stream_counts'), test_results.get('analise'))
+    
+    with app.metrics.stage('armazenamento'):
+        save_to_csv(
+            m3u_url=m3u_url,
+            server=credentials['server'],
+            port=credentials['port'],
+            username=credentials['username'],
+            password=credentials['password'],
+            created_date=account_info['created_date'],
+            exp_date=account_info['exp_date_formatted'],
+            total_channels=total_canais,
+            status=account_info.get('status', 'unknown'),
+            canal_origem=canal_titulo,
+            mensagem_id=mensagem_id,
+            observacoes=observacoes,
+            analise=analise,
+            trial=trial,
+            hash_playlist=test_results.get('hash_playlist', '')
+        )
+    
+    logger.info(
+        f"Lista IPTV válida e salva no {app.store.nome}: {total_canais} canais, "
+        f"status {account_info.get('status', 'unknown')}, vencimento {account_info['exp_date_formatted']}",
+        extra={
+            'evento': 'link_valido',
+            'canal_origem': canal_titulo,
+            'servidor': credentials['server'],
+            'total_canais': total_canais,
+            'canais_ao_vivo': analise['canais_ao_vivo'],
+            'filmes': analise['filmes'],
+            'series': analise['series'],
+            'taxa_funcionamento': analise['taxa_funcionamento'],
+            'status': account_info.get('status', 'unknown'),
+            'vencimento': account_info['exp_date_formatted']
+        }
+    )
+    
+    # Enviar para webhook do n8n se configurado
+    if app.webhook_dispatcher:
+        dados_webhook = {
+            'timestamp': datetime.now().isoformat(),
+            'tipo': 'lista_iptv_valida',
+            'link_m3u': m3u_url,
+            'servidor': credentials['server'],
+            'porta': credentials['port'],
+            'username': credentials['username'],
+            'password': credentials['password'],
+            'data_criacao': account_info['created_date'],
+            'data_vencimento': account_info['exp_date_formatted'],
+            'total_canais': total_canais,
+            'analise': {
+                'canais_ao_vivo': analise['canais_ao_vivo'],
+                'filmes': analise['filmes'],
+                'series': analise['series'],
+                'taxa_funcionamento': analise['taxa_funcionamento'],
+                'grupos': (test_results.get('analise') or {}).get('grupos', {}),
+                'amostra': (test_results.get('analise') or {}).get('amostra')
+            },
+            'status': account_info.get('status', 'unknown'),
+            'is_trial': account_info.get('is_trial', False),
+            'active_cons': account_info.get('active_cons', 0),
+            'max_connections': account_info.get('max_connections', 0),
+            'canal_origem': {
+                'titulo': canal_titulo,
+                'id': canal_id
+            },
+            'mensagem': {
+                'id': mensagem_id,
+                'data': mensagem_data
+            },
+            'teste': {
+                'origem': test_results['origem'],
+                'accessible': test_results['accessible'],
+                'valid_m3u': test_results['valid_m3u'],
+                'total_channels': total_canais,
+                'stream_counts': test_results.get('stream_counts'),
+                'hash_playlist': test_results.get('hash_playlist'),
+                'reaproveitado': test_results.get('reaproveitado')
+            }
+        }
+        
+        # Entrega em background (lote, retry e spool em disco)
+        app.webhook_dispatcher.enqueue(dados_webhook)
+        logger.debug(f"Dados enfileirados para o webhook do n8n ({app.webhook_dispatcher.pending()} pendente(s))")
+    
+    return 'valido'
+
+
+async def enviar_webhook(payload: Dict) -> bool:
+    """Entrega um evento (ou lote) ao webhook registrando duração e resultado nas métricas"""
+    try:
+        with app.metrics.stage('webhook'):
+            enviado = await app.webhook_sender.send_iptv_data(payload)
+    except WebhookRejected:
+        app.metrics.inc('webhook_envios_total', {'resultado': 'rejeitado'}, help='Tentativas de entrega ao webhook')
+        raise
+    app.metrics.inc('webhook_envios_total', {'resultado': 'ok' if enviado else 'falha'},
+                help='Tentativas de entrega ao webhook')
+    return enviado
+
+
+async def fechar_conexoes():
+    """Para o pool de testes e o webhook, grava cache e armazenamento e fecha os pools HTTP"""
+    # Só o que chegou a ser criado: fechar não deve abrir banco nem sessões
+    if app.is_built('link_pool'):
+        await app.link_pool.stop()
+    if app.is_built('revalidator') and app.revalidator is not None:
+        await app.revalidator.stop()
+    if app.is_built('metrics_exporter'):
+        await app.metrics_exporter.stop()
+    if app.is_built('accounts_api') and app.accounts_api is not None:
+        await app.accounts_api.stop()
+    if app.is_built('result_cache') and app.result_cache is not None:
+        app.result_cache.save()
+    if app.is_built('store'):
+        app.store.close()
+    if app.is_built('iptv_http'):
+        await app.iptv_http.close()
+    if app.is_built('webhook_dispatcher') and app.webhook_dispatcher:
+        # Entrega o que der dentro do timeout do webhook; o restante fica no spool
+        await app.webhook_dispatcher.stop(timeout=app.config.webhook_timeout)
+    if app.is_built('webhook_sender') and app.webhook_sender:
+        await app.webhook_sender.http.close()
+
+
+def espera_reinicio(tentativa: int, base: float, maximo: float) -> float:
+    """Espera antes de reiniciar: backoff exponencial com jitter (evita reconexões em rajada)"""
+    espera = min(maximo, base * (2 ** tentativa))
+    return espera * random.uniform(0.5, 1.0)
+
+
+def iniciar_processos():
+    """
+    Com PROCESSOS_TESTE > 1, cria os processos de teste e o escritor
+    
+    Deve rodar antes de o cliente conectar: os processos são criados por fork e
+    este processo passa a só receber mensagens e distribuir os links.
+    """
+    pipeline = ShardedPipeline(sys.modules[__name__], app.config.processos_teste,
+                               queue_size=app.config.tamanho_fila)
+    app.link_pool = pipeline.start()
+    app.metrics.gauge('fila_testes', app.link_pool.qsize, 'Links aguardando envio aos processos de teste')
+    return pipeline
 
 
 def iniciar_bot():
     """Inicia o bot e monitora mensagens"""
+    config = carregar_configuracao()
+    pipeline = iniciar_processos() if config.processos_teste > 1 else None
+    
+    print("="*60)
+    print("BOT TELEGRAM -> TESTADOR IPTV")
+    print("="*60)
+    print(f"\nBot iniciado. Monitorando mensagens...")
+    print(f"Canais de origem: {config.canais_origem}")
+    print(f"Testar automaticamente: {config.testar_automatico}")
+    if config.armazenamento == 'sqlite':
+        print(f"Banco SQLite: {config.db_arquivo} (exportar: python storage.py exportar-csv)")
+    else:
+        print(f"Arquivo CSV: {CSV_FILE}")
+    if config.webhook_url:
+        print(f"Webhook N8N: {redact(config.webhook_url)}")
+    else:
+        print(f"Webhook N8N: Não configurado")
+    if config.metricas_porta:
+        print(f"Métricas: http://{config.metricas_host}:{config.metricas_porta}/metrics")
+    if config.revalidacao_ativa:
+        print(f"Revalidação: a cada {config.revalidacao_intervalo:.0f}s")
+    if config.contas_api_porta:
+        print(f"API de contas: http://{config.contas_api_host}:{config.contas_api_porta}/contas")
+    if pipeline is not None:
+        print(f"Processos de teste: {config.processos_teste} (+ 1 escritor)")
+    if config.palavras_chave:
+        print(f"Palavras-chave: {config.palavras_chave}")
+    if config.palavras_bloqueadas:
+        print(f"Palavras bloqueadas: {config.palavras_bloqueadas}")
+    if config.substituicoes:
+        print(f"Substituições configuradas: {config.substituicoes}")
+    print("\nPressione Ctrl+C para parar o bot\n")
+    
+    # Cliente, pools HTTP, fila de testes e armazenamento são reaproveitados entre reinícios
+    client = app.client
+    tentativa = 0
     while True:
+        inicio = time.monotonic()
         try:
-            print("="*60)
-            print("BOT TELEGRAM -> TESTADOR IPTV")
-            print("="*60)
-            print(f"\nBot iniciado. Monitorando mensagens...")
-            print(f"Canais de origem: {config.canais_origem}")
-            print(f"Testar automaticamente: {config.testar_automatico}")
-            print(f"Arquivo CSV: {CSV_FILE}")
-            if config.webhook_url:
-                print(f"Webhook N8N: {config.webhook_url}")
-            else:
-                print(f"Webhook N8N: Não configurado")
-            if config.palavras_chave:
-                print(f"Palavras-chave: {config.palavras_chave}")
-            if config.palavras_bloqueadas:
-                print(f"Palavras bloqueadas: {config.palavras_bloqueadas}")
-            if config.substituicoes:
-                print(f"Substituições configuradas: {config.substituicoes}")
-            print("\nPressione Ctrl+C para parar o bot\n")
-            
             with client:
+                if app.webhook_dispatcher and pipeline is None:
+                    # Reenvia eventos que ficaram no spool em execuções anteriores
+                    client.loop.call_soon(app.webhook_dispatcher.start)
+                client.loop.run_until_complete(app.metrics_exporter.start())
+                if app.accounts_api is not None and pipeline is None:
+                    client.loop.run_until_complete(app.accounts_api.start())
+                if app.revalidator is not None and pipeline is None:
+                    client.loop.call_soon(app.revalidator.start, config.revalidacao_intervalo)
                 client.run_until_disconnected()
         except KeyboardInterrupt:
-            print("\n[INFO] Bot interrompido pelo usuário")
+            logger.info("Bot interrompido pelo usuário")
+            client.loop.run_until_complete(fechar_conexoes())
+            if pipeline is not None:
+                pipeline.stop()
             break
         except Exception as e:
-            print(f"[ERRO] O bot parou devido a: {e}")
-            print("Tentando reiniciar em 10 segundos...")
-            time.sleep(10)
+            if time.monotonic() - inicio > config.reinicio_espera_max:
+                # Ficou de pé por um bom tempo: recomeça o backoff do início
+                tentativa = 0
+            espera = espera_reinicio(tentativa, config.reinicio_espera, config.reinicio_espera_max)
+            tentativa += 1
+            logger.error(f"O bot parou devido a: {e}; tentando reiniciar em {espera:.1f} segundos",
+                         extra={'evento': 'reinicio', 'tentativa': tentativa})
+            time.sleep(espera)
 
 
 if __name__ == '__main__':
     iniciar_bot()
-
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filtros de texto do handler compilados uma única vez
+Palavras-chave e palavras bloqueadas verificadas em uma só passada; substituições
+aplicadas em sequência, na ordem configurada
+"""
+
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+_KEYWORD = 1
+_BLOCKED = 2
+
+
+class MatchResult(NamedTuple):
+    has_keyword: bool
+    blocked: bool
+    texto: str
+
+
+class TextMatcher:
+    """
+    Palavras-chave e bloqueadas em uma alternância regex aplicada em lookahead
+
+    O lookahead encontra o termo mais longo em cada posição do texto (inclusive
+    sobrepostos). Os termos mais curtos que começam na mesma posição são
+    prefixos do mais longo, então suas categorias são pré-calculadas por termo.
+
+    As substituições mantêm a semântica original: são aplicadas em sequência,
+    na ordem de SUBSTITUICOES, cada uma sobre o resultado da anterior (com
+    {'foo': 'bar', 'bar': 'baz'}, 'foo bar' vira 'baz baz'). Os padrões são
+    compilados uma única vez.
+    """
+
+    def __init__(self, palavras_chave: Iterable[str] = (), palavras_bloqueadas: Iterable[str] = (),
+                 substituicoes: Optional[Dict[str, str]] = None):
+        self.palavras_chave = [p.lower() for p in palavras_chave if p]
+        self.palavras_bloqueadas = [p.lower() for p in palavras_bloqueadas if p]
+        self.substituicoes = {k: v for k, v in (substituicoes or {}).items() if k}
+        self._substitutions: List[Tuple[re.Pattern, str]] = [
+            (re.compile(re.escape(original), re.IGNORECASE), nova)
+            for original, nova in self.substituicoes.items()
+        ]
+
+        flags: Dict[str, int] = {}
+        for term in self.palavras_chave:
+            flags[term] = flags.get(term, 0) | _KEYWORD
+        for term in self.palavras_bloqueadas:
+            flags[term] = flags.get(term, 0) | _BLOCKED
+
+        terms = sorted(flags, key=len, reverse=True)
+        self._flags: Dict[str, int] = {}
+        for term in terms:
+            self._flags[term] = 0
+            for other in terms:
+                if term.startswith(other):
+                    self._flags[term] |= flags[other]
+
+        self._pattern = None
+        if terms:
+            alternation = '|'.join(re.escape(term) for term in terms)
+            self._pattern = re.compile(f'(?=({alternation}))', re.IGNORECASE)
+
+    @classmethod
+    def from_config(cls, config) -> 'TextMatcher':
+        return cls(config.palavras_chave, config.palavras_bloqueadas, config.substituicoes)
+
+    def scan(self, texto: str) -> MatchResult:
+        """Verifica palavras-chave e bloqueadas em uma passada e aplica as substituições"""
+        if not texto:
+            return MatchResult(False, False, texto)
+
+        found = 0
+        if self._pattern is not None:
+            complete = _KEYWORD | _BLOCKED
+            for match in self._pattern.finditer(texto):
+                found |= self._flags.get(match.group(1).lower(), 0)
+                if found == complete:
+                    break
+
+        has_keyword = bool(found & _KEYWORD)
+        blocked = bool(found & _BLOCKED)
+        # Mensagem que será descartada não precisa das substituições
+        if not blocked and (has_keyword or not self.palavras_chave):
+            texto = self.substitute(texto)
+        return MatchResult(has_keyword, blocked, texto)
+
+    def substitute(self, texto: str) -> str:
+        """Aplica apenas as substituições, em sequência"""
+        for pattern, nova in self._substitutions:
+            texto = pattern.sub(nova, texto)
+        return texto
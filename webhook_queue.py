@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Entrega assíncrona de eventos para o webhook do n8n
+Agrupa eventos em lotes, tenta novamente com backoff exponencial e mantém os
+pendentes em um spool no disco para sobreviver a reinícios e quedas do n8n.
+Lotes recusados de vez pelo webhook (4xx) vão para a pasta de rejeitados.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 4xx que valem nova tentativa; os demais não mudam repetindo o mesmo lote
+RETRY_STATUS = {408, 429}
+
+
+def is_retryable(status: Optional[int]) -> bool:
+    """Falha temporária: sem resposta (conexão/timeout), 5xx, 408 ou 429"""
+    return status is None or status >= 500 or status in RETRY_STATUS
+
+
+class WebhookRejected(Exception):
+    """O webhook recusou o lote de forma permanente (ex.: 400, 401, 413)"""
+
+    def __init__(self, status: int, message: str = ''):
+        super().__init__(f"{status} {message}".strip())
+        self.status = status
+
+
+class WebhookDispatcher:
+    """
+    Fila de eventos do webhook com entrega em background
+
+    `send` retorna True quando entregou e False em falha temporária (nova
+    tentativa com backoff); WebhookRejected move o lote para `dead_letter_dir`
+    (padrão: <spool_dir>/rejeitados) e a entrega segue com os próximos eventos.
+    """
+
+    def __init__(self, send: Callable[[Dict], Awaitable[bool]], spool_dir: str = 'webhook_spool',
+                 batch_size: int = 1, linger: float = 2.0, backoff_base: float = 2.0,
+                 backoff_max: float = 300.0, dead_letter_dir: Optional[str] = None):
+        self.send = send
+        self.spool_dir = spool_dir
+        self.dead_letter_dir = dead_letter_dir or os.path.join(spool_dir, 'rejeitados')
+        self.batch_size = max(1, batch_size)
+        self.linger = linger
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.delivered = 0
+        self.failures = 0
+        self.rejected = 0
+        self._sending = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._seq = itertools.count()
+
+    def pending(self) -> int:
+        """Eventos ainda não entregues"""
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self):
+        """Carrega o spool do disco e inicia a entrega no event loop atual (idempotente)"""
+        if self._task is not None and not self._task.done():
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._queue = asyncio.Queue()
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._queue.put_nowait((path, json.load(f)))
+            except (OSError, ValueError) as e:
+                logger.error(f"Evento inválido no spool do webhook {path}: {str(e)}")
+        if self._queue.qsize():
+            logger.info(f"{self._queue.qsize()} evento(s) pendente(s) recuperado(s) do spool do webhook")
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def enqueue(self, payload: Dict):
+        """Grava o evento no spool e o coloca na fila (não bloqueia o handler)"""
+        self.start()
+        name = f"{time.time_ns():020d}-{next(self._seq):06d}.json"
+        path = os.path.join(self.spool_dir, name)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # Sem spool o evento ainda é entregue, mas não sobrevive a um reinício
+            logger.error(f"Erro ao gravar evento no spool do webhook: {str(e)}")
+            path = ''
+        self._queue.put_nowait((path, payload))
+
+    async def stop(self, timeout: float = 0):
+        """
+        Interrompe a entrega; eventos não entregues continuam no spool
+
+        Com `timeout`, espera até esse tempo a fila esvaziar e o lote em
+        andamento terminar antes de cancelar a tarefa.
+        """
+        if self._task is not None and timeout > 0:
+            deadline = time.monotonic() + timeout
+            while (self.pending() or self._sending) and not self._task.done() and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _next_batch(self) -> List[Tuple[str, Dict]]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _body(self, batch: List[Tuple[str, Dict]]) -> Dict:
+        if self.batch_size == 1:
+            # Lote de 1: mantém o formato original (um objeto por POST)
+            return batch[0][1]
+        return {
+            'timestamp': batch[-1][1].get('timestamp'),
+            'tipo': 'lote_listas_iptv',
+            'total': len(batch),
+            'itens': [payload for _, payload in batch]
+        }
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            body = self._body(batch)
+
+            attempt = 0
+            self._sending = True
+            try:
+                while not await self.send(body):
+                    self.failures += 1
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                    delay *= random.uniform(0.5, 1.0)
+                    attempt += 1
+                    logger.warning(f"Webhook falhou ({len(batch)} evento(s)), nova tentativa {attempt} em {delay:.0f}s")
+                    await asyncio.sleep(delay)
+            except WebhookRejected as e:
+                self.rejected += len(batch)
+                self._dead_letter(batch)
+                logger.error(f"Webhook recusou {len(batch)} evento(s) ({e}); movido(s) para {self.dead_letter_dir}",
+                             extra={'evento': 'webhook_rejeitado', 'status_http': e.status})
+                continue
+            finally:
+                self._sending = False
+
+            self.delivered += len(batch)
+            for path, _ in batch:
+                if path:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def _dead_letter(self, batch: List[Tuple[str, Dict]]):
+        """Tira os eventos do spool (não são reenviados) e os guarda para inspeção"""
+        try:
+            os.makedirs(self.dead_letter_dir, exist_ok=True)
+        except OSError as e:
+            logger.error(f"Erro ao criar a pasta de eventos rejeitados: {str(e)}")
+            return
+        for path, payload in batch:
+            target = os.path.join(self.dead_letter_dir, os.path.basename(path) if path else
+                                  f"{time.time_ns():020d}-{next(self._seq):06d}.json")
+            try:
+                if path:
+                    os.replace(path, target)
+                else:
+                    with open(target, 'w', encoding='utf-8') as f:
+                        json.dump(payload, f, ensure_ascii=False)
+            except OSError as e:
+                logger.error(f"Erro ao mover evento rejeitado {path or target}: {str(e)}")
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fila de jobs e pool de workers para testar links IPTV em paralelo
+Limita a concorrência global e por servidor, com backpressure quando a fila enche
+e atendimento justo (round-robin ponderado) entre os canais de origem
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+def server_key(m3u_url: str) -> str:
+    """Chave host:porta usada para limitar requisições por servidor"""
+    try:
+        parsed = urlparse(m3u_url)
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        return f"{(parsed.hostname or '').lower()}:{port}"
+    except ValueError:
+        return m3u_url
+
+
+class FairQueue:
+    """
+    Fila limitada com uma sub-fila por grupo (canal de origem)
+
+    Os grupos com jobs pendentes são atendidos em round-robin ponderado: cada um
+    entrega até `peso` jobs seguidos antes de passar a vez. Além do limite total
+    (`maxsize`), cada grupo pode ter no máximo `max_per_group` jobs na fila, de
+    modo que um canal que publica centenas de links só bloqueia a si mesmo.
+
+    get() pode receber um filtro `ready`: itens que ainda não podem ser atendidos
+    (ex.: servidor já no limite) ficam na fila e os seguintes são entregues.
+    """
+
+    def __init__(self, maxsize: int = 0, max_per_group: int = 0, weights: Optional[Dict[str, int]] = None):
+        self.maxsize = maxsize
+        self.max_per_group = max_per_group
+        self.weights = weights or {}
+        self._groups: Dict[str, deque] = {}
+        self._order: deque = deque()
+        self._served = 0
+        self._size = 0
+        self._unfinished = 0
+        self._changed = asyncio.Condition()
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def qsize(self) -> int:
+        return self._size
+
+    def group_size(self, group: str) -> int:
+        jobs = self._groups.get(group)
+        return len(jobs) if jobs else 0
+
+    def full(self, group: Optional[str] = None) -> bool:
+        if self.maxsize > 0 and self._size >= self.maxsize:
+            return True
+        return group is not None and self.max_per_group > 0 and self.group_size(group) >= self.max_per_group
+
+    async def put(self, group: str, job: Any):
+        """Enfileira o job no grupo; aguarda enquanto a fila ou o grupo estiverem cheios"""
+        async with self._changed:
+            await self._changed.wait_for(lambda: not self.full(group))
+            jobs = self._groups.get(group)
+            if jobs is None:
+                jobs = self._groups[group] = deque()
+                self._order.append(group)
+            jobs.append(job)
+            self._size += 1
+            self._unfinished += 1
+            self._finished.clear()
+            self._changed.notify_all()
+
+    async def get(self, ready: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Próximo job pelo round-robin ponderado entre os grupos
+
+        Com `ready`, entrega o primeiro job que o filtro aceitar, aguardando wake()
+        enquanto nenhum for aceito.
+        """
+        async with self._changed:
+            while True:
+                taken = self._take(ready) if self._size else None
+                if taken is not None:
+                    self._changed.notify_all()
+                    return taken[0]
+                await self._changed.wait()
+
+    def _take(self, ready: Optional[Callable[[Any], bool]]):
+        for position, group in enumerate(self._order):
+            jobs = self._groups[group]
+            for index, job in enumerate(jobs):
+                if ready is None or ready(job):
+                    break
+            else:
+                continue
+            del jobs[index]
+            self._size -= 1
+            if position == 0:
+                self._served += 1
+            if not jobs:
+                del self._groups[group]
+                del self._order[position]
+                if position == 0:
+                    self._served = 0
+            elif position == 0 and self._served >= max(1, self.weights.get(group, 1)):
+                self._order.rotate(-1)
+                self._served = 0
+            return (job,)
+        return None
+
+    async def wake(self):
+        """Reavalia o filtro dos get() em espera (ex.: um servidor liberou vaga)"""
+        async with self._changed:
+            self._changed.notify_all()
+
+    def task_done(self):
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+
+class WorkerPool:
+    """
+    Pool de workers asyncio alimentado por uma fila limitada
+
+    Os jobs são agrupados pelo campo `group_by` (canal de origem) em uma FairQueue.
+    Um worker só retira da fila jobs de servidores com vaga (`max_per_server`):
+    uma rajada para um servidor não ocupa os workers enquanto outros aguardam.
+    """
+
+    def __init__(self, process: Callable[[Dict], Awaitable], workers: int = 10,
+                 max_concurrency: int = 20, max_per_server: int = 2, queue_size: int = 500,
+                 max_per_group: int = 0, weights: Optional[Dict[str, int]] = None,
+                 group_by: str = 'canal_titulo'):
+        self.process = process
+        self.workers = max(1, workers)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_per_server = max(1, max_per_server)
+        self.queue_size = queue_size
+        self.max_per_group = max_per_group
+        self.weights = weights or {}
+        self.group_by = group_by
+        self.queue: Optional[FairQueue] = None
+        self._global: Optional[asyncio.Semaphore] = None
+        # Testes em andamento por servidor (host:porta)
+        self._running: Dict[str, int] = {}
+        self._tasks = []
+        self.active = 0
+
+    def start(self):
+        """Cria a fila e os workers no event loop atual (idempotente)"""
+        if self._tasks:
+            return
+        self.queue = FairQueue(self.queue_size, self.max_per_group, self.weights)
+        self._global = asyncio.Semaphore(self.max_concurrency)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Pool de testes iniciado: {self.workers} workers, "
+                    f"{self.max_concurrency} simultâneos, {self.max_per_server} por servidor")
+
+    async def submit(self, job: Dict):
+        """Enfileira um job; aguarda (backpressure) enquanto a fila estiver cheia"""
+        self.start()
+        group = str(job.get(self.group_by, ''))
+        if self.queue.full(group):
+            logger.warning(f"Fila de testes cheia ({self.queue.qsize()}, {self.queue.group_size(group)} de "
+                           f"{group or 'origem desconhecida'}), aguardando espaço...")
+        await self.queue.put(group, (server_key(job.get('m3u_url', '')), job))
+
+    def qsize(self) -> int:
+        return self.queue.qsize() if self.queue else 0
+
+    async def join(self):
+        """Aguarda até que todos os jobs enfileirados sejam processados"""
+        if self.queue:
+            await self.queue.join()
+
+    async def stop(self):
+        """Cancela os workers (jobs ainda na fila são descartados)"""
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.queue = None
+
+    def _server_ready(self, item) -> bool:
+        return self._running.get(item[0], 0) < self.max_per_server
+
+    def _release_server(self, key: str):
+        self._running[key] -= 1
+        if not self._running[key]:
+            del self._running[key]
+
+    async def _worker(self, number: int):
+        while True:
+            key, job = await self.queue.get(self._server_ready)
+            # Vaga reservada antes de qualquer await: outro get() já a enxerga ocupada
+            self._running[key] = self._running.get(key, 0) + 1
+            try:
+                async with self._global:
+                    self.active += 1
+                    try:
+                        await self.process(job)
+                    finally:
+                        self.active -= 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Worker {number}: erro ao processar {key}: {e!r}")
+            finally:
+                self._release_server(key)
+                self.queue.task_done()
+            await self.queue.wake()